@@ -1,4 +1,12 @@
+import projection_viewer.cache
 import projection_viewer.callbacks
 import projection_viewer.frontend
+import projection_viewer.metrics
 import projection_viewer.processors
+import projection_viewer.profiling
+import projection_viewer.registry
+import projection_viewer.sampling
+import projection_viewer.spatial
+import projection_viewer.structures
 import projection_viewer.utils
+import projection_viewer.xyz_reader
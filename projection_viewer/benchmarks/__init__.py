@@ -0,0 +1,3 @@
+"""
+Performance benchmarks of the viewer, each module can be ran with `python -m projection_viewer.benchmarks.<module>`
+"""
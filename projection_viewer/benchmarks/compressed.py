@@ -0,0 +1,115 @@
+"""
+Benchmark of loading compressed xyz files: streaming them (`utils.build_dataset()` of the compressed file, see
+`xyz_reader.iter_frame_batches()`), compared to decompressing them onto the disk first and reading the plain file,
+and to reading them with ase.io.read, which decompresses them into memory.
+
+Each workflow runs in a fresh process, its wall time and peak RSS above the RSS at its start are reported.
+
+Usage:
+    python -m projection_viewer.benchmarks.compressed --fxyz processed.xyz --mode atomic --n-copies 20 --compression xz
+    python -m projection_viewer.benchmarks.compressed --fxyz processed.xyz --n-copies 5 --compression gz --with-ase
+"""
+
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ase.io
+
+from projection_viewer import profiling
+from projection_viewer import utils
+
+OPENERS = {'gz': gzip.open, 'xz': lzma.open, 'bz2': bz2.open}
+
+
+def write_compressed(filename, compression='gz', n_copies=1, directory=None):
+    """Writes the frames of the file `n_copies` times into a compressed file, returns its path"""
+    with open(filename, 'rb') as f:
+        text = f.read()
+
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.xyz.' + compression)
+    os.close(fd)
+    with OPENERS[compression](path, 'wb') as f:
+        for _ in range(n_copies):
+            f.write(text)
+
+    return path
+
+
+def _run_workflow(args):
+    """Runs one workflow in the worker process, returns its wall time and peak RSS increase"""
+    workflow, path, mode = args
+    rss_start = profiling.get_current_rss()
+    t0 = time.perf_counter()
+
+    if workflow == 'stream':
+        dataset = utils.build_dataset(path, mode=mode, n_workers=1, verbose=False)
+    elif workflow == 'decompress':
+        fd, plain_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.xyz')
+        try:
+            with os.fdopen(fd, 'wb') as plain, OPENERS[path.rsplit('.', 1)[1]](path, 'rb') as compressed:
+                shutil.copyfileobj(compressed, plain, 4 * 1024 ** 2)
+            dataset = utils.build_dataset(plain_path, mode=mode, n_workers=1, verbose=False)
+        finally:
+            os.remove(plain_path)
+    elif workflow == 'ase':
+        dataset = utils.build_dataset_from_atoms(ase.io.read(path, ':'), mode=mode)
+    else:
+        raise ValueError('Unknown workflow `{}`'.format(workflow))
+
+    return dict(workflow=workflow, time=time.perf_counter() - t0,
+                peak_rss_increase=profiling.get_peak_rss() - rss_start, n_rows=len(dataset['df']),
+                table_bytes=int(dataset['df'].memory_usage(deep=True).sum()))
+
+
+def benchmark_compressed(path, mode='atomic', workflows=('stream', 'decompress', 'ase')):
+    """
+    Loads the compressed file with each workflow, each in a new process so their peak memory is measured apart.
+
+    :return: list of dicts with the workflow, wall time in seconds, peak RSS increase in bytes, number of rows and
+        memory of the feature table in bytes
+    """
+    results = []
+    for workflow in workflows:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(_run_workflow, (workflow, path, mode)).result())
+
+    return results
+
+
+def main(filename, mode='atomic', compression='gz', n_copies=1, with_ase=False):
+    path = write_compressed(filename, compression=compression, n_copies=n_copies)
+    workflows = ('stream', 'decompress', 'ase') if with_ase else ('stream', 'decompress')
+    try:
+        print('{}: {:.2f} MB compressed'.format(os.path.basename(path), os.path.getsize(path) / 1e6))
+        for result in benchmark_compressed(path, mode=mode, workflows=workflows):
+            print('{workflow:>10}: {time:8.3f} s, peak RSS +{rss:8.1f} MB, {n_rows} rows, feature table '
+                  '{table:6.1f} MB'.format(rss=result['peak_rss_increase'] / 1e6, table=result['table_bytes'] / 1e6,
+                                           **result))
+    finally:
+        os.remove(path)
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fxyz', type=str, required=True, help='Location of the (uncompressed) xyz file')
+    parser.add_argument('--mode', type=str, default='atomic', help='Mode of projection ([molecular], [atomic])')
+    parser.add_argument('--compression', type=str, default='gz', choices=sorted(OPENERS),
+                        help='Compression of the file benchmarked')
+    parser.add_argument('--n-copies', type=int, default=1,
+                        help='Number of times the frames of the file are repeated, for scaling up the dataset')
+    parser.add_argument('--with-ase', action='store_true',
+                        help='Also time ase.io.read of the compressed file, which is much slower than the others')
+    args = parser.parse_args()
+
+    sys.exit(main(args.fxyz, mode=args.mode, compression=args.compression, n_copies=args.n_copies,
+                  with_ase=args.with_ase))
@@ -0,0 +1,111 @@
+"""
+Benchmark of the construction of the feature table, compared to the original implementation.
+
+Usage:
+    python -m projection_viewer.benchmarks.dataframe --fxyz processed.xyz --mode atomic --repeat 3
+"""
+
+import argparse
+import sys
+import timeit
+
+import ase.io
+import numpy as np
+import pandas as pd
+
+from projection_viewer import utils
+
+
+def legacy_build_dataframe_features(atoms, mode='molecular'):
+    """
+    The original implementation of `utils.build_dataframe_features()`, kept only as a reference for benchmarking.
+
+    Builds every atomic column with a nested comprehension over all atoms of all geometries.
+    """
+    if mode == 'atomic':
+        keys = atoms[0].arrays.keys()
+    else:
+        keys = atoms[0].info.keys()
+
+    keys_expanded = {}
+
+    if mode == 'atomic':
+        at_numbers = np.array([i for mol in atoms for i, y in enumerate(list(mol.get_chemical_symbols()))])
+        sys_ids = []
+        for i, mol in enumerate(atoms):
+            sys_ids += [i] * len(mol)
+        keys_expanded['system_ids'] = sys_ids
+        keys_expanded['atomic_numbers'] = at_numbers
+    elif mode == 'molecular':
+        keys_expanded['system_ids'] = list(range(len(atoms)))
+
+    for k in keys:
+        try:
+            if mode == 'atomic':
+                if len(atoms[0].arrays[k].shape) > 1:
+                    for i in range(atoms[0].arrays[k].shape[1]):
+                        keys_expanded[k + '_' + str(i)] = np.array(
+                            [x.arrays[k][j][i] for x in atoms for j in range(len(x))]).flatten()
+                else:
+                    keys_expanded[k] = np.array([x.arrays[k][j] for x in atoms for j in range(len(x))]).flatten()
+                    continue
+
+            else:
+                if isinstance(atoms[0].info[k], np.ndarray):
+                    for i in range(len(atoms[0].info[k])):
+                        keys_expanded[k + '_' + str(i)] = [x.info[k][i] for x in atoms]
+                else:
+                    keys_expanded[k] = [x.info[k] for x in atoms]
+        except KeyError as err:
+            print('Skipping key:', err)
+
+    return pd.DataFrame(data=keys_expanded)
+
+
+def benchmark_build_dataframe_features(atoms_list, mode='atomic', repeat=3):
+    """
+    Times the legacy and the current feature table construction on the same geometries.
+
+    :return: dict with the best wall times in seconds, the speedup and whether the two tables are identical
+    """
+    df_legacy = legacy_build_dataframe_features(atoms_list, mode=mode)
+    df_new = utils.build_dataframe_features(atoms_list, mode=mode)
+
+    try:
+        pd.testing.assert_frame_equal(df_legacy, df_new, check_dtype=False)
+        identical = True
+    except AssertionError:
+        identical = False
+
+    t_legacy = min(timeit.repeat(lambda: legacy_build_dataframe_features(atoms_list, mode=mode),
+                                 number=1, repeat=repeat))
+    t_new = min(timeit.repeat(lambda: utils.build_dataframe_features(atoms_list, mode=mode),
+                              number=1, repeat=repeat))
+
+    return dict(mode=mode, n_frames=len(atoms_list), n_rows=len(df_new), n_columns=len(df_new.columns),
+                time_legacy=t_legacy, time_new=t_new, speedup=t_legacy / t_new, identical=identical)
+
+
+def main(filename, mode='atomic', repeat=3, n_copies=1):
+    atoms_list = ase.io.read(filename, ':') * n_copies
+    result = benchmark_build_dataframe_features(atoms_list, mode=mode, repeat=repeat)
+
+    print('build_dataframe_features(mode={mode}): {n_frames} frames, {n_rows} rows, {n_columns} columns'.format(
+        **result))
+    print('    legacy:  {:10.4f} s'.format(result['time_legacy']))
+    print('    new:     {:10.4f} s'.format(result['time_new']))
+    print('    speedup: {:10.1f} x, identical output: {}'.format(result['speedup'], result['identical']))
+
+    return 0 if result['identical'] else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fxyz', type=str, required=True, help='Location of xyz file')
+    parser.add_argument('--mode', type=str, default='atomic', help='Mode of projection ([molecular], [atomic])')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timing repetitions, the best is reported')
+    parser.add_argument('--n-copies', type=int, default=1,
+                        help='Number of times the frames of the file are repeated, for scaling up the dataset')
+    args = parser.parse_args()
+
+    sys.exit(main(args.fxyz, mode=args.mode, repeat=args.repeat, n_copies=args.n_copies))
@@ -0,0 +1,66 @@
+"""
+Benchmark of the size of the figure sent to the browser by `callbacks.update_graph()`, by encoding of the arrays.
+
+Usage:
+    python -m projection_viewer.benchmarks.figure --n-points 1000000
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from projection_viewer import callbacks
+from projection_viewer import utils
+from projection_viewer.registry import registry
+
+
+def register_random_dataset(n_points, n_columns=4, seed=0):
+    """Registers a dataset of random features without geometries and returns the app-data referring to it"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'feature_{}'.format(i): rng.normal(size=n_points) for i in range(n_columns)})
+
+    dataset_id = 'benchmark-random-{}-{}-{}'.format(n_points, n_columns, seed)
+    registry.register(dataset_id, dict(df=df, system_index=np.arange(n_points), atom_index_in_systems=None,
+                                       structures=None, mode='molecular', dataset_id=dataset_id))
+
+    return dict(dataset_id=dataset_id, mode='molecular', styles=dict(height_graph=500), webgl=True)
+
+
+def benchmark_figure_payload(n_points, precisions=('json', 'float64', 'float32')):
+    """
+    Constructs the figure of a random dataset with each encoding and measures its size and construction time.
+
+    :return: list of dicts with the precision, payload bytes and time in seconds
+    """
+    data = register_random_dataset(n_points)
+
+    results = []
+    for precision in precisions:
+        data['figure_precision'] = precision
+        t0 = time.perf_counter()
+        figure = callbacks.update_graph(data, 0, 1, 2, 3, [5, 50], [0, 100], [0, 100], None, None)
+        t1 = time.perf_counter()
+        payload_bytes = utils.get_figure_payload_size(figure)
+        t2 = time.perf_counter()
+        results.append(dict(precision=precision, n_points=n_points, payload_bytes=payload_bytes,
+                            time_figure=t1 - t0, time_serialise=t2 - t1))
+
+    return results
+
+
+def main(n_points):
+    for result in benchmark_figure_payload(n_points):
+        print('{precision:>8}: {n_points} points, {mb:8.2f} MB, figure {time_figure:6.3f} s, '
+              'JSON serialisation {time_serialise:6.3f} s'.format(mb=result['payload_bytes'] / 1e6, **result))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-points', type=int, default=1000000, help='Number of points of the graph')
+    args = parser.parse_args()
+
+    sys.exit(main(args.n_points))
@@ -0,0 +1,355 @@
+"""
+Load test of the server of `scripts/visualize_plot` with many concurrent sessions, without browsers.
+
+Every simulated session replays what a user does in the browser by sending the requests of the Dash renderer to the
+`_dash-update-component` endpoint: loading the page (the dropdown options, the graph and the 3D viewer), changing the
+colour dropdown, dragging the marker size slider, hovering and clicking points and editing the periodic repetition.
+The inputs of the callbacks are taken from the layout of the app (`_dash-layout`) and their specification from
+`_dash-dependencies`, so the requests match the ones of the browser. Each session has its own connection.
+
+The latency percentiles of each action, the throughput and the memory of the server process during the run are
+reported, and optionally written as JSON. The server is started on a free port unless `--url` is given; its memory is
+read from `/proc` when started here, and from its `/metrics` (`--metrics` of `visualize_plot`) otherwise.
+
+Usage:
+    python -m projection_viewer.benchmarks.load_test --fxyz processed.xyz --mode atomic --sessions 8 --iterations 5
+    python -m projection_viewer.benchmarks.load_test --url http://localhost:9999 --sessions 32 --output load.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+# outputs of the callbacks requested, as in `_dash-dependencies`
+GRAPH_OUTPUT = 'store-graph-figure.data'
+DROPDOWN_OUTPUT = '..dropdown-x-axis.options...dropdown-y-axis.options...dropdown-marker-size.options...' \
+                  'dropdown-marker-colour.options..'
+VIEWER_OUTPUT = 'div-3dviewer.children'
+HOVER_OUTPUT = 'markdown-hover-info.children'
+
+PERIODIC_REPETITIONS = ['(0,2) (0,2) (0,2)', '(0,1) (0,1) (0,1)']
+SLIDER_STEPS = 5
+
+
+def get_free_port():
+    """A port nobody listens on, for the server started here"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(filenames, mode='atomic', port=None, timeout=300., log_filename=os.devnull):
+    """
+    Starts `scripts/visualize_plot` on the files and waits until it serves the app.
+
+    :return: the subprocess.Popen of the server and its URL
+    """
+    port = get_free_port() if port is None else port
+    script = os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'visualize_plot')
+    with open(log_filename, 'w') as log:
+        process = subprocess.Popen([sys.executable, script, '--fxyz', *filenames, '--mode', mode, '--port', str(port),
+                                    '--metrics'], stdout=log, stderr=subprocess.STDOUT)
+    url = 'http://127.0.0.1:{}'.format(port)
+
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        if process.poll() is not None:
+            raise RuntimeError('The server exited with code {}, see {}'.format(process.returncode, log_filename))
+        try:
+            with urllib.request.urlopen(url + '/_dash-layout', timeout=5):
+                return process, url
+        except OSError:
+            time.sleep(0.5)
+
+    process.terminate()
+    raise TimeoutError('The server did not start in {} s'.format(timeout))
+
+
+def _get_json(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def get_layout_values(layout):
+    """Values of the properties of the components of the layout with an id, by `<id>.<property>`"""
+    values = dict()
+    stack = [layout]
+    while stack:
+        component = stack.pop()
+        if isinstance(component, list):
+            stack.extend(component)
+        elif isinstance(component, dict) and 'props' in component:
+            props = component['props']
+            if isinstance(props.get('id'), str):
+                for name, value in props.items():
+                    values['{}.{}'.format(props['id'], name)] = value
+            stack.append(props.get('children'))
+    return values
+
+
+def get_outputs(output):
+    """The `outputs` of the request of a callback from its output string, one or a list of several"""
+    def split(item):
+        component_id, prop = item.split('.', 1)
+        return dict(id=component_id, property=prop)
+
+    if output.startswith('..'):
+        return [split(item) for item in output[2:-2].split('...')]
+    return split(output)
+
+
+class Session:
+    """
+    One simulated browser session: the values of the properties of its components and a connection to the server.
+    """
+
+    def __init__(self, url, dependencies, layout_values, seed=0):
+        parsed = urllib.parse.urlparse(url)
+        self._connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=300)
+        self._path = (parsed.path.rstrip('/') or '') + '/_dash-update-component'
+        self._dependencies = dependencies
+        self.values = dict(layout_values)
+        self.random = random.Random(seed)
+        self.n_rows = 1
+        self.n_columns = 1
+        # (action, output, latency, status, response bytes) of the requests
+        self.records = []
+
+    def call(self, action, output, changed):
+        """
+        Requests the callback of `output` with the current values, `changed` being the properties that triggered it.
+
+        :return: dict of the response, None if the update was prevented or failed
+        """
+        dependency = self._dependencies[output]
+        body = dict(output=output, outputs=get_outputs(output),
+                    inputs=[dict(item, value=self.values.get('{id}.{property}'.format(**item)))
+                            for item in dependency['inputs']],
+                    state=[dict(item, value=self.values.get('{id}.{property}'.format(**item)))
+                           for item in dependency['state']],
+                    changedPropIds=changed)
+        payload = json.dumps(body).encode('utf-8')
+
+        t0 = time.perf_counter()
+        try:
+            self._connection.request('POST', self._path, body=payload, headers={'Content-Type': 'application/json'})
+            response = self._connection.getresponse()
+            content = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self._connection.close()
+            content, status = b'', 0
+        self.records.append((action, output, time.perf_counter() - t0, status, len(content)))
+
+        return json.loads(content) if status == 200 else None
+
+    def load_page(self):
+        """The callbacks run when the page is loaded"""
+        changed = ['app-memory.data']
+        response = self.call('load', DROPDOWN_OUTPUT, changed)
+        if response is not None:
+            self.n_columns = max(len(response['response']['dropdown-marker-colour']['options']), 1)
+        self.update_graph('load', changed)
+        self.call('load', VIEWER_OUTPUT, changed)
+
+    def update_graph(self, action, changed):
+        response = self.call(action, GRAPH_OUTPUT, changed)
+        try:
+            self.n_rows = response['response']['store-graph-figure']['data']['layout']['meta']['n_rows']
+        except (TypeError, KeyError):
+            pass
+
+    def change_dropdown(self):
+        self.values['dropdown-marker-colour.value'] = self.random.randrange(self.n_columns)
+        self.update_graph('dropdown', ['dropdown-marker-colour.value'])
+
+    def drag_slider(self):
+        """Dragging the marker size limits slider sends a request on every step"""
+        for step in range(SLIDER_STEPS):
+            self.values['slider_marker_size_limits.value'] = [0, 100 - step * 10]
+            self.update_graph('slider', ['slider_marker_size_limits.value'])
+
+    def click_point(self):
+        """Hovering a point, then clicking it"""
+        row = self.random.randrange(self.n_rows)
+        point = dict(curveNumber=0, pointNumber=row, pointIndex=row, customdata=[row])
+        self.values['graph.hoverData'] = dict(points=[point])
+        self.call('hover', HOVER_OUTPUT, ['graph.hoverData'])
+        self.values['graph.clickData'] = dict(points=[point])
+        self.call('click', VIEWER_OUTPUT, ['graph.clickData'])
+
+    def edit_periodic_repetition(self):
+        for repetition in PERIODIC_REPETITIONS:
+            self.values['input_periodic_repetition_structure.value'] = repetition
+            self.call('periodic', VIEWER_OUTPUT, ['input_periodic_repetition_structure.value'])
+
+    def run(self, iterations, think_time=0.):
+        self.load_page()
+        for _ in range(iterations):
+            for action in [self.change_dropdown, self.drag_slider, self.click_point, self.edit_periodic_repetition]:
+                action()
+                if think_time > 0:
+                    time.sleep(self.random.uniform(0., 2. * think_time))
+        self._connection.close()
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of the server in the background, from /proc if its process id is known or from /metrics"""
+
+    def __init__(self, url, pid=None, interval=0.2):
+        super().__init__(daemon=True)
+        self.url = url
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def get_rss(self):
+        try:
+            if self.pid is not None:
+                with open('/proc/{}/status'.format(self.pid)) as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            return int(line.split()[1]) * 1024
+            else:
+                with urllib.request.urlopen(self.url + '/metrics', timeout=5) as response:
+                    for line in response.read().decode('utf-8').splitlines():
+                        if line.startswith('projection_viewer_process_resident_memory_bytes '):
+                            return int(float(line.split()[1]))
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = self.get_rss()
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        rss = self.get_rss()
+        if rss is not None:
+            self.samples.append(rss)
+
+
+def run_load_test(url, n_sessions=8, iterations=5, think_time=0., pid=None, seed=0):
+    """
+    Runs `n_sessions` sessions concurrently against the server at `url`.
+
+    :return: dict of the latency percentiles by action, the throughput and the memory of the server
+    """
+    dependencies = {dependency['output']: dependency for dependency in _get_json(url + '/_dash-dependencies')
+                    if dependency.get('clientside_function') is None}
+    for output in [GRAPH_OUTPUT, DROPDOWN_OUTPUT, VIEWER_OUTPUT, HOVER_OUTPUT]:
+        if output not in dependencies:
+            raise KeyError('The app has no callback of `{}`'.format(output))
+    layout_values = get_layout_values(_get_json(url + '/_dash-layout'))
+
+    sessions = [Session(url, dependencies, layout_values, seed=seed + i) for i in range(n_sessions)]
+    threads = [threading.Thread(target=session.run, args=(iterations, think_time)) for session in sessions]
+
+    sampler = MemorySampler(url, pid=pid)
+    rss_start = sampler.get_rss()
+    sampler.start()
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - t0
+    sampler.stop()
+
+    records = [record for session in sessions for record in session.records]
+    return dict(url=url, sessions=n_sessions, iterations=iterations, think_time=think_time, wall_time=wall_time,
+                requests=len(records), throughput=len(records) / wall_time,
+                errors=sum(1 for record in records if record[3] not in (200, 204)),
+                actions=summarise_records(records),
+                server_rss_start=rss_start,
+                server_rss_peak=max(sampler.samples) if sampler.samples else None,
+                server_rss_end=sampler.samples[-1] if sampler.samples else None)
+
+
+def summarise_records(records):
+    """Number, errors, latency percentiles in seconds and mean response bytes of the requests of each action"""
+    summary = dict()
+    for action in sorted(set(record[0] for record in records)):
+        selected = [record for record in records if record[0] == action]
+        latencies = np.array([record[2] for record in selected])
+        summary[action] = dict(requests=len(selected),
+                               errors=sum(1 for record in selected if record[3] not in (200, 204)),
+                               p50=float(np.percentile(latencies, 50)), p90=float(np.percentile(latencies, 90)),
+                               p99=float(np.percentile(latencies, 99)), max=float(np.max(latencies)),
+                               mean_response_bytes=float(np.mean([record[4] for record in selected])))
+    return summary
+
+
+def _format_mb(value):
+    return '-' if value is None else '{:.1f} MB'.format(value / 1e6)
+
+
+def main(filenames=None, mode='atomic', url=None, n_sessions=8, iterations=5, think_time=0., output=None,
+         server_log=os.devnull):
+    process = None
+    if url is None:
+        process, url = start_server(filenames, mode=mode, log_filename=server_log)
+    try:
+        result = run_load_test(url.rstrip('/'), n_sessions=n_sessions, iterations=iterations, think_time=think_time,
+                               pid=None if process is None else process.pid)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print('{sessions} sessions x {iterations} iterations: {requests} requests in {wall_time:.2f} s, '
+          '{throughput:.1f} requests/s, {errors} errors'.format(**result))
+    for action, summary in result['actions'].items():
+        print('    {:<10} {:6d} requests, p50 {:8.1f} ms, p90 {:8.1f} ms, p99 {:8.1f} ms, max {:8.1f} ms, '
+              '{:10.0f} bytes'.format(action, summary['requests'], 1e3 * summary['p50'], 1e3 * summary['p90'],
+                                      1e3 * summary['p99'], 1e3 * summary['max'], summary['mean_response_bytes']))
+    print('Server RSS: {} at the start, {} peak, {} at the end'.format(
+        _format_mb(result['server_rss_start']), _format_mb(result['server_rss_peak']),
+        _format_mb(result['server_rss_end'])))
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print('Written the results to {}'.format(output))
+
+    return 0 if result['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fxyz', type=str, nargs='+', default=None,
+                        help='Location of the xyz file(s) the server is started on, unless --url is given')
+    parser.add_argument('--mode', type=str, default='atomic', help='Mode of projection ([molecular], [atomic])')
+    parser.add_argument('--url', type=str, default=None,
+                        help='URL of a running server, e.g. http://localhost:9999, instead of starting one')
+    parser.add_argument('--sessions', type=int, default=8, help='Number of concurrent sessions')
+    parser.add_argument('--iterations', type=int, default=5,
+                        help='Number of times each session repeats the sequence of actions after loading the page')
+    parser.add_argument('--think-time', type=float, default=0.,
+                        help='Mean seconds of waiting between the actions of a session')
+    parser.add_argument('--output', type=str, default=None, help='JSON file the results are written to')
+    parser.add_argument('--server-log', type=str, default=os.devnull, help='File of the output of the server started')
+    args = parser.parse_args()
+
+    if args.url is None and args.fxyz is None:
+        parser.error('either --fxyz or --url is needed')
+
+    sys.exit(main(args.fxyz, mode=args.mode, url=args.url, n_sessions=args.sessions, iterations=args.iterations,
+                  think_time=args.think_time, output=args.output, server_log=args.server_log))
@@ -0,0 +1,177 @@
+"""
+Benchmark suite on synthetic extended XYZ files (see `synthetic.write_synthetic_xyz()`) of preset or custom scales.
+
+For each scale, times loading the file (`utils.load_xyz()`, without the on-disk cache, with its per-stage load
+report), constructing the feature table (`utils.build_dataframe_features()`), the figure of the graph
+(`callbacks.update_graph()`), the data of the 3D viewer (`visualiser.construct_3d_view_data()`) and a periodic
+supercell (`utils.make_periodic_ase_at()`, of periodic files only). The results are written as JSON, with the
+versions of the libraries, for comparing runs.
+
+Usage:
+    python -m projection_viewer.benchmarks.suite --scales small medium --mode atomic --output results.json
+    python -m projection_viewer.benchmarks.suite --n-frames 5000 --n-atoms 128 --vector-width 500
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+import ase.io
+
+from projection_viewer import callbacks
+from projection_viewer import utils
+from projection_viewer.benchmarks import synthetic
+from projection_viewer.frontend import visualiser
+from projection_viewer.registry import registry
+
+# arguments of `synthetic.write_synthetic_xyz()` of the preset scales
+SCALES = {
+    'small': dict(n_frames=100, n_atoms=32),
+    'medium': dict(n_frames=1000, n_atoms=64),
+    'large': dict(n_frames=10000, n_atoms=64),
+    'wide': dict(n_frames=1000, n_atoms=32, n_vector_keys=2, vector_width=250),
+}
+
+PERIODIC_REPETITION = '(0,2) (0,2) (0,2)'
+
+
+def get_environment():
+    """Versions of Python and of the libraries, and the machine, for comparing results"""
+    versions = dict()
+    for package in ['numpy', 'pandas', 'ase', 'dash', 'plotly', 'scipy']:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+
+    return dict(python=platform.python_version(), platform=platform.platform(), cpu_count=os.cpu_count(),
+                versions=versions)
+
+
+def _time(function, repeat):
+    """Wall times of `repeat` calls of `function`, and the value returned by the last one"""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        value = function()
+        times.append(time.perf_counter() - t0)
+    return times, value
+
+
+def _result(benchmark, times, **info):
+    return dict(benchmark=benchmark, time=min(times), times=times, **info)
+
+
+def benchmark_scale(filename, mode='atomic', repeat=3):
+    """
+    Times the stages of the viewer on one file.
+
+    :return: list of dicts with the name of the benchmark, the best wall time `time` in seconds, all of them `times`
+        and the size of what was produced
+    """
+    results = []
+
+    # loading, the registry is cleared so each repetition builds the dataset
+    def load():
+        registry.clear()
+        return utils.load_xyz(filename, mode=mode, verbose=False, cache=False, return_report=True)
+
+    times, (data, load_report) = _time(load, repeat)
+    dataset = utils.get_dataset(data)
+    results.append(_result('load_xyz', times, rows=len(dataset['df']), columns=len(dataset['df'].columns),
+                           stages=load_report['stages']))
+
+    # feature table of the geometries read beforehand
+    atoms_list = ase.io.read(filename, ':')
+    times, df = _time(lambda: utils.build_dataframe_features(atoms_list, mode=mode), repeat)
+    results.append(_result('build_dataframe_features', times, rows=len(df), columns=len(df.columns)))
+
+    # figure of the graph, like on the first render
+    data.update(styles=dict(height_graph=500), webgl=True, soap_cutoff_radius=4.5, marker_radius=1.0)
+    keys = [min(i, len(dataset['df'].columns) - 1) for i in range(4)]
+    times, figure = _time(lambda: callbacks.update_graph(data, *keys, [5, 50], [0, 100], [0, 100], None, None),
+                          repeat)
+    results.append(_result('update_graph', times, points=len(dataset['df']),
+                           payload_bytes=utils.get_figure_payload_size(figure)))
+
+    # 3D viewer of the first point
+    times, viewer_data = _time(lambda: visualiser.construct_3d_view_data(data, 0, '(0,1) (0,1) (0,1)'), repeat)
+    results.append(_result('construct_3d_view_data', times, atoms=len(viewer_data['modelData']['atoms']),
+                           payload_bytes=len(json.dumps(viewer_data))))
+
+    # periodic supercell of the first geometry, only if it has a cell
+    if atoms_list[0].cell.rank == 3:
+        times, supercell = _time(lambda: utils.make_periodic_ase_at(atoms_list[0], PERIODIC_REPETITION), repeat)
+        results.append(_result('make_periodic_ase_at', times, atoms=len(supercell), repetition=PERIODIC_REPETITION))
+
+    registry.clear()
+    return results
+
+
+def run_suite(scales, mode='atomic', repeat=3, directory=None):
+    """
+    Writes the synthetic file of each scale into a temporary directory and benchmarks it.
+
+    :param scales: dict of the name of each scale and the arguments of `synthetic.write_synthetic_xyz()`
+    :return: dict of the environment and the results, one dict per benchmark and scale
+    """
+    results = []
+    directory = tempfile.mkdtemp(dir=directory)
+    try:
+        for name, scale in scales.items():
+            filename = os.path.join(directory, '{}.xyz'.format(name))
+            file_info = synthetic.write_synthetic_xyz(filename, **scale)
+            for result in benchmark_scale(filename, mode=mode, repeat=repeat):
+                results.append(dict(scale=name, parameters=scale, file_bytes=file_info['bytes'], mode=mode,
+                                    **result))
+                print('{:>8} {:<26} {:10.4f} s'.format(name, result['benchmark'], result['time']))
+    finally:
+        shutil.rmtree(directory)
+
+    return dict(environment=get_environment(), timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), repeat=repeat,
+                results=results)
+
+
+def main(scales, mode='atomic', repeat=3, output=None):
+    suite = run_suite(scales, mode=mode, repeat=repeat)
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(suite, f, indent=2)
+        print('Written the results to {}'.format(output))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=str, nargs='+', default=['small', 'medium'], choices=sorted(SCALES),
+                        help='Preset scales of the synthetic files')
+    parser.add_argument('--mode', type=str, default='atomic', help='Mode of projection ([molecular], [atomic])')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timing repetitions, the best is reported')
+    parser.add_argument('--output', type=str, default=None, help='JSON file the results are written to')
+    # a custom scale instead of the presets
+    parser.add_argument('--n-frames', type=int, default=None, help='Custom scale: number of geometries')
+    parser.add_argument('--n-atoms', type=int, default=32, help='Custom scale: number of atoms of each geometry')
+    parser.add_argument('--n-info-keys', type=int, default=2, help='Custom scale: number of scalar info keys')
+    parser.add_argument('--n-array-keys', type=int, default=2, help='Custom scale: number of scalar per-atom keys')
+    parser.add_argument('--n-vector-keys', type=int, default=1,
+                        help='Custom scale: number of vector valued info and per-atom keys each')
+    parser.add_argument('--vector-width', type=int, default=8,
+                        help='Custom scale: number of components of the vector valued keys')
+    parser.add_argument('--periodic', nargs='?', type=utils.str2bool, const=True, default=True,
+                        help='Custom scale: cubic cells with periodic boundary conditions')
+    args = parser.parse_args()
+
+    if args.n_frames is not None:
+        selected = dict(custom=dict(n_frames=args.n_frames, n_atoms=args.n_atoms, n_info_keys=args.n_info_keys,
+                                    n_array_keys=args.n_array_keys, n_vector_keys=args.n_vector_keys,
+                                    vector_width=args.vector_width, periodic=args.periodic))
+    else:
+        selected = {name: SCALES[name] for name in args.scales}
+
+    sys.exit(main(selected, mode=args.mode, repeat=args.repeat, output=args.output))
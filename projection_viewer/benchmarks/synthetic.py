@@ -0,0 +1,100 @@
+"""
+Synthetic extended XYZ files of configurable size, for benchmarking without real datasets.
+
+Every frame has `n_atoms` atoms of `n_species` elements at random positions. It has the info keys `info_<i>`
+(scalars) and `info_vector_<i>` (vectors of `vector_width` components), and the per-atom keys `array_<i>` and
+`descriptor_<i>` alike, like the energies and the SOAP vectors of a real file. Keys like `energy` are not used, ase
+moves them onto a calculator and they are not columns of the feature table. Periodic frames have a cubic cell, the
+others none.
+
+Usage:
+    python -m projection_viewer.benchmarks.synthetic --output synthetic.xyz --n-frames 1000 --n-atoms 64
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from projection_viewer.utils import str2bool
+
+SPECIES = ('H', 'C', 'N', 'O', 'Si', 'Cu', 'Fe', 'Pt')
+
+# atoms per cubic Angstrom of the periodic cells
+ATOM_DENSITY = 0.08
+
+
+def write_synthetic_xyz(filename, n_frames=100, n_atoms=32, n_info_keys=2, n_array_keys=2, n_vector_keys=1,
+                        vector_width=8, n_species=3, periodic=True, seed=0):
+    """
+    Writes a synthetic extended XYZ file.
+
+    :param n_frames: number of geometries
+    :param n_atoms: number of atoms of each geometry
+    :param n_info_keys: number of scalar info keys
+    :param n_array_keys: number of scalar per-atom keys
+    :param n_vector_keys: number of vector valued info and per-atom keys each
+    :param vector_width: number of components of the vector valued keys
+    :param n_species: number of elements, at most `len(SPECIES)`
+    :param periodic: bool, cubic cells with periodic boundary conditions
+    :param seed: seed of the random values, the same arguments write the same file
+    :return: dict of the number of frames, the total number of atoms and the bytes of the file
+    """
+    rng = np.random.default_rng(seed)
+    species = np.array(SPECIES[:max(1, min(n_species, len(SPECIES)))])
+    box = (n_atoms / ATOM_DENSITY) ** (1. / 3.)
+
+    info_names = ['info_{}'.format(i) for i in range(n_info_keys)]
+    array_names = ['array_{}'.format(i) for i in range(n_array_keys)]
+    properties = 'species:S:1:pos:R:3' + ''.join(':{}:R:1'.format(name) for name in array_names) + \
+                 ''.join(':descriptor_{}:R:{}'.format(i, vector_width) for i in range(n_vector_keys))
+    row_format = '{} ' + ' '.join(['{:.8f}'] * (3 + n_array_keys + n_vector_keys * vector_width)) + '\n'
+    lattice = 'Lattice="{0:.6f} 0.0 0.0 0.0 {0:.6f} 0.0 0.0 0.0 {0:.6f}" '.format(box) if periodic else ''
+    pbc = 'pbc="T T T"' if periodic else 'pbc="F F F"'
+
+    n_bytes = 0
+    with open(filename, 'w') as f:
+        for _ in range(n_frames):
+            info = ' '.join('{}={:.8f}'.format(name, value)
+                            for name, value in zip(info_names, rng.normal(size=n_info_keys)))
+            info_vectors = ' '.join('info_vector_{}="{}"'.format(i, ' '.join('{:.8f}'.format(x) for x in
+                                                                              rng.normal(size=vector_width)))
+                                    for i in range(n_vector_keys))
+            symbols = species[rng.integers(len(species), size=n_atoms)]
+            values = np.hstack([rng.uniform(0., box, size=(n_atoms, 3)),
+                                rng.normal(size=(n_atoms, n_array_keys + n_vector_keys * vector_width))])
+
+            text = '{}\n{}Properties={} {} {} {}\n'.format(n_atoms, lattice, properties, info, info_vectors, pbc) + \
+                   ''.join(row_format.format(symbol, *row) for symbol, row in zip(symbols, values.tolist()))
+            f.write(text)
+            n_bytes += len(text)
+
+    return dict(n_frames=n_frames, n_atoms=n_frames * n_atoms, bytes=n_bytes)
+
+
+def main(filename, **kwargs):
+    result = write_synthetic_xyz(filename, **kwargs)
+    print('Written {}: {n_frames} frames, {n_atoms} atoms, {mb:.2f} MB'.format(filename, mb=result['bytes'] / 1e6,
+                                                                                **result))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, required=True, help='Location of the xyz file written')
+    parser.add_argument('--n-frames', type=int, default=100, help='Number of geometries')
+    parser.add_argument('--n-atoms', type=int, default=32, help='Number of atoms of each geometry')
+    parser.add_argument('--n-info-keys', type=int, default=2, help='Number of scalar info keys')
+    parser.add_argument('--n-array-keys', type=int, default=2, help='Number of scalar per-atom keys')
+    parser.add_argument('--n-vector-keys', type=int, default=1,
+                        help='Number of vector valued info and per-atom keys each')
+    parser.add_argument('--vector-width', type=int, default=8, help='Number of components of the vector valued keys')
+    parser.add_argument('--n-species', type=int, default=3, help='Number of elements')
+    parser.add_argument('--periodic', nargs='?', type=str2bool, const=True, default=True,
+                        help='Cubic cells with periodic boundary conditions')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random values')
+    args = parser.parse_args()
+
+    sys.exit(main(args.output, n_frames=args.n_frames, n_atoms=args.n_atoms, n_info_keys=args.n_info_keys,
+                  n_array_keys=args.n_array_keys, n_vector_keys=args.n_vector_keys, vector_width=args.vector_width,
+                  n_species=args.n_species, periodic=args.periodic, seed=args.seed))
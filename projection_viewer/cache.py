@@ -0,0 +1,199 @@
+"""
+Persistent on-disk cache of the datasets constructed by `utils.load_xyz()`.
+
+A cache entry is a single uncompressed NPZ file holding the columns of the feature table, the per-point index arrays,
+the arrays of the structure store and the string lists (joined into one UTF-8 buffer with offsets). It is keyed by the
+absolute path of the input file, the mode and the column filter, and it is rebuilt when the size or modification time
+of the input file changes.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from projection_viewer.structures import StructureStore
+
+# increase this when the content of the cache changes, so old cache files are rebuilt
+CACHE_VERSION = 6
+
+
+def get_default_cache_dir():
+    """Directory of the cache files, `$XDG_CACHE_HOME/projection_viewer` or `~/.cache/projection_viewer`"""
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'projection_viewer')
+
+
+def get_cache_key(filename, mode, column_filter=None):
+    """Dictionary identifying the content of the input file, used to decide if a cache file is stale"""
+    stat = os.stat(filename)
+    key = dict(path=os.path.abspath(filename), size=stat.st_size, mtime=stat.st_mtime_ns, mode=mode,
+               version=CACHE_VERSION)
+    if column_filter is not None:
+        key['columns'] = column_filter
+    return key
+
+
+def get_cache_path(filename, mode, cache_dir=None, column_filter=None):
+    """Location of the cache file of `filename` in `mode`; one file per input file, mode and column filter"""
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir()
+
+    source = '{}:{}'.format(os.path.abspath(filename), mode)
+    if column_filter is not None:
+        source += ':' + json.dumps(column_filter, sort_keys=True)
+    path_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, '{}-{}-{}.npz'.format(os.path.basename(filename), mode, path_hash))
+
+
+def _pack_strings(strings):
+    """Joins a list of strings into a single UTF-8 buffer and the offsets of the items in it"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(buffer, offsets):
+    """Inverse of `_pack_strings()`"""
+    buffer = buffer.tobytes()
+    return [buffer[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def _encode_dataset(dataset):
+    """
+    Translates the dataset into arrays that can be written into an NPZ without pickling.
+
+    Supported values: pd.DataFrame (of numeric, string and categorical columns), StructureStore, pd.Series,
+    np.ndarray, list of str and None.
+    """
+    arrays = dict()
+    kinds = dict()
+
+    for name, value in dataset.items():
+        if value is None:
+            kinds[name] = 'none'
+        elif isinstance(value, pd.DataFrame):
+            kinds[name] = 'dataframe'
+            columns = []
+            for i, (column, series) in enumerate(value.items()):
+                is_numeric = pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)
+                is_category = isinstance(series.dtype, pd.CategoricalDtype)
+                columns.append(dict(name=column, string=not is_numeric, category=is_category))
+                if is_category:
+                    # the codes and the categories as strings
+                    arrays['{}/{}/codes'.format(name, i)] = series.cat.codes.to_numpy()
+                    arrays['{}/{}/buffer'.format(name, i)], arrays['{}/{}/offsets'.format(name, i)] = \
+                        _pack_strings([str(x) for x in series.cat.categories])
+                elif not is_numeric:
+                    arrays['{}/{}/buffer'.format(name, i)], arrays['{}/{}/offsets'.format(name, i)] = \
+                        _pack_strings([str(x) for x in series])
+                else:
+                    arrays['{}/{}'.format(name, i)] = series.to_numpy()
+            kinds[name + '/columns'] = columns
+        elif isinstance(value, StructureStore):
+            kinds[name] = 'structures'
+            for key, array in value.to_arrays().items():
+                arrays['{}/{}'.format(name, key)] = array
+        elif isinstance(value, (pd.Series, np.ndarray)):
+            kinds[name] = 'array'
+            arrays[name] = np.asarray(value)
+        elif isinstance(value, list):
+            kinds[name] = 'strings'
+            arrays[name + '/buffer'], arrays[name + '/offsets'] = _pack_strings(value)
+        else:
+            raise TypeError('Cannot cache `{}` of type {}'.format(name, type(value)))
+
+    return arrays, kinds
+
+
+def _decode_dataset(npz, kinds):
+    """Inverse of `_encode_dataset()`"""
+    dataset = dict()
+
+    for name, kind in kinds.items():
+        if kind == 'none':
+            dataset[name] = None
+        elif kind == 'dataframe':
+            columns = dict()
+            for i, column in enumerate(kinds[name + '/columns']):
+                if column.get('category', False):
+                    columns[column['name']] = pd.Categorical.from_codes(
+                        npz['{}/{}/codes'.format(name, i)],
+                        _unpack_strings(npz['{}/{}/buffer'.format(name, i)], npz['{}/{}/offsets'.format(name, i)]))
+                elif column['string']:
+                    columns[column['name']] = _unpack_strings(npz['{}/{}/buffer'.format(name, i)],
+                                                              npz['{}/{}/offsets'.format(name, i)])
+                else:
+                    columns[column['name']] = npz['{}/{}'.format(name, i)]
+            dataset[name] = pd.DataFrame(columns)
+        elif kind == 'structures':
+            dataset[name] = StructureStore(**{key: npz['{}/{}'.format(name, key)]
+                                              for key in ['numbers', 'positions', 'cells', 'pbc', 'offsets']})
+        elif kind == 'array':
+            dataset[name] = npz[name]
+        elif kind == 'strings':
+            dataset[name] = _unpack_strings(npz[name + '/buffer'], npz[name + '/offsets'])
+
+    return dataset
+
+
+def read_cache(filename, mode, cache_dir=None, verbose=True, column_filter=None):
+    """
+    Reads the cached dataset of `filename`.
+
+    :return: dict of the cached dataset, or None if there is no cache file or it is stale
+    """
+    cache_path = get_cache_path(filename, mode, cache_dir, column_filter=column_filter)
+    if not os.path.isfile(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path, allow_pickle=False) as npz:
+            meta = json.loads(npz['__meta__'].tobytes().decode('utf-8'))
+            if meta['key'] != get_cache_key(filename, mode, column_filter=column_filter):
+                if verbose:
+                    print('Cache of {} is stale, rebuilding it'.format(filename))
+                return None
+            dataset = _decode_dataset(npz, meta['kinds'])
+    except (OSError, ValueError, KeyError) as e:
+        print('Failed to read the cache file {}, rebuilding it: {}'.format(cache_path, repr(e)))
+        return None
+
+    if verbose:
+        print('Read cached dataset from {}'.format(cache_path))
+
+    return dataset
+
+
+def write_cache(filename, mode, dataset, cache_dir=None, verbose=True, column_filter=None):
+    """
+    Writes the dataset into the cache file of `filename`, replacing any previous one.
+
+    The file is written under a temporary name first, so concurrent readers never see a partial cache file.
+
+    :return: path of the cache file
+    """
+    cache_path = get_cache_path(filename, mode, cache_dir, column_filter=column_filter)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    arrays, kinds = _encode_dataset(dataset)
+    meta = dict(key=get_cache_key(filename, mode, column_filter=column_filter), kinds=kinds)
+    arrays['__meta__'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if verbose:
+        print('Written cache of {} to {}'.format(filename, cache_path))
+
+    return cache_path
@@ -1,19 +1,41 @@
-import copy
 import subprocess
 import sys
 import traceback
 
 import dash_bio
 import numpy as np
-import pandas as pd
 import plotly.graph_objects as go
 from dash import callback_context
 from dash.exceptions import PreventUpdate
 
+try:
+    from dash import Patch
+except ImportError:
+    # partial updates of the figure need Dash 2.9, the whole figure is sent otherwise, and files cannot be followed
+    Patch = None
+
 from projection_viewer import processors
+from projection_viewer import spatial
 from projection_viewer import utils
 from projection_viewer.frontend import visualiser
 
+# density render mode: largest number of points in the viewport shown as markers, and pixels per bin of the heatmap
+DEFAULT_DENSITY_MAX_POINTS = 100000
+DEFAULT_DENSITY_BIN_PX = 2
+# viewport render mode: largest number of points sent per request
+DEFAULT_VIEWPORT_MAX_POINTS = 200000
+
+# inputs of update_graph() that change only the marker sizes or colours, updated without re-sending the figure
+MARKER_SIZE_INPUTS = {'dropdown-marker-size.value', 'slider_marker_size_range.value',
+                      'slider_marker_size_limits.value'}
+MARKER_COLOUR_INPUTS = {'dropdown-marker-colour.value'}
+# inputs of update_graph() that change the projection, the graph is autoranged (see `uirevision`) without a relayout
+# event, so the ranges of the last one are stale
+PROJECTION_INPUTS = {'app-memory.data', 'dropdown-x-axis.value', 'dropdown-y-axis.value'}
+
+# following a file: number of traces of appended points in the figure, after which it is constructed again as one
+FOLLOW_MAX_TRACES = 10
+
 
 def show_summary(click, q_val, p_val):
     """
@@ -129,11 +151,37 @@ def update_all_data_on_new_query(n_clicks, q_value, p_value, data_originally, pr
 ################################################
 
 def update_graph(data, x_axis_key, y_axis_key, marker_size_key, marker_colour_key, marker_size_range,
-                 marker_size_limits, marker_colour_limits, marker_opacity_value, colourscale_name):
+                 marker_size_limits, marker_colour_limits, marker_opacity_value, colourscale_name, relayout_data=None):
     """
+    With `data['render_mode'] == 'density'` the points in the viewport given by `relayout_data` are aggregated into a
+    heatmap on the server once there are more than `data['density_max_points']` of them, see `get_density_trace()`,
+    and are shown as markers otherwise.
+
+    With `data['render_mode'] == 'viewport'` only the points in the viewport are sent, at most
+    `data['viewport_max_points']` of them, with a coarse summary of the points outside of it, see
+    `get_summary_trace()`.
+
+    The figure is written into a store, the opacity, colourscale and colour limits are applied onto it in the browser
+    by the clientside callback `frontend.clientside.APPLY_FIGURE_STYLE`, so changing them needs no request to the
+    server. They are only States here, the figure is complete on its own as well.
+
+    With `data['sampling']` set in markers mode, a sample of the points is shown (see `utils.get_sample_rows()`),
+    and on zooming the points of the viewport are added at full resolution, at most `data['viewport_max_points']` of
+    them. The sampled points keep their rows of the full feature table, for the hover and the 3D viewer.
+
+    With `data['slider_scale'] == 'quantile'` the marker size and colour limits are percentiles of the columns
+    instead of percentages of their range, see `utils.get_column_limits()`.
+
+    If only the marker size or colour inputs triggered the callback (see `MARKER_SIZE_INPUTS` and
+    `MARKER_COLOUR_INPUTS`), only the affected attributes of the first trace are updated with a `dash.Patch`, the
+    positions and the hover data are not sent again. Not for followed files, the figure of which can have more
+    traces of appended points, see `follow_file()`.
+
+    The number of rows of the dataset shown is saved in the `meta` of the layout, for `follow_file()`, with the
+    limits of the marker sizes and colours of a followed file, see `get_marker_limits()`.
 
     Default decorator:
-    @app.callback(Output('graph', 'figure'),
+    @app.callback(Output('store-graph-figure', 'data'),
               [Input('app-memory', 'data'),
                Input('dropdown-x-axis', 'value'),
                Input('dropdown-y-axis', 'value'),
@@ -141,91 +189,104 @@ def update_graph(data, x_axis_key, y_axis_key, marker_size_key, marker_colour_ke
                Input('dropdown-marker-colour', 'value'),
                Input('slider_marker_size_range', 'value'),
                Input('slider_marker_size_limits', 'value'),
-               Input('slider_marker_color_limits', 'value'),
-               Input('input-marker-opacity', 'value'),
-               Input('input-colourscale', 'value')])
+               Input('graph', 'relayoutData')],
+              [State('slider_marker_color_limits', 'value'),
+               State('input-marker-opacity', 'value'),
+               State('input-colourscale', 'value')])
 
     """
+    render_mode = data.get('render_mode', 'markers')
+    sampling = data.get('sampling') if render_mode == 'markers' else None
+    triggered = get_triggered_prop_ids()
+    if render_mode not in ('density', 'viewport') and not sampling and triggered == {'graph.relayoutData'}:
+        # zooming and panning is handled by the browser alone
+        raise PreventUpdate
+    if triggered == {'graph.relayoutData'} and not spatial.is_viewport_change(relayout_data):
+        # e.g. a new drag mode or selection, the viewport is the same
+        raise PreventUpdate
+    # the full extent of a new projection, not the ranges of the axes shown before
+    viewport = (None, None) if triggered & PROJECTION_INPUTS else spatial.parse_viewport(relayout_data)
 
-    # hack it out from there for now
+    # the dataset is looked up on the server side, only its id is sent by the browser
     try:
-        dataframe = pd.read_json(data['df_json'])
+        dataset = utils.get_dataset(data)
     except KeyError:
         print('DEBUG, PreventUpdate; Key Error in update_graph:\nkeys:\n    {}'.format(data.keys()))
         raise PreventUpdate
-
-    # todo: add context action to decide what to update if too slow
-
-    # color limits
-    color_new = copy.copy(dataframe[dataframe.columns.tolist()[marker_colour_key]])
-    color_span = np.abs(np.max(color_new) - np.min(color_new))
-    color_new_min = np.min(color_new)
-    color_new_lower = color_new_min + color_span / 100. * marker_colour_limits[0]
-    color_new_upper = color_new_min + color_span / 100. * marker_colour_limits[1]
-    # indices_in_limits = np.asarray(
-    #     [idx for idx, val in enumerate(color_new) if color_new_lower <= val <= color_new_upper])
+    dataframe = dataset['df']
 
     # marker opacity value to float
     marker_opacity_value = utils.process_marker_opacity_value(marker_opacity_value)
 
-    # marker size
-    size_new = copy.copy(dataframe[dataframe.columns.tolist()[marker_size_key]].tolist())  # fixme this is messy
-    size_new = np.array(size_new)
-    size_new = size_new - np.min(size_new)  # cant be smaller than 0
-    size_new_range = np.max(size_new)
-    size_new_lower = size_new_range / 100. * marker_size_limits[0]
-    size_new_upper = size_new_range / 100. * marker_size_limits[1]
+    # the points of the viewport in density and viewport mode, the sample and the points of the viewport with
+    # sampling, all of them otherwise
+    x_new = utils.get_column(dataset, x_axis_key)
+    y_new = utils.get_column(dataset, y_axis_key)
+    rows = None
+    if sampling:
+        rows = utils.get_sample_rows(dataset, sampling, x_axis_key, y_axis_key)
+        if viewport != (None, None):
+            grid_index = utils.get_grid_index(dataset, x_axis_key, y_axis_key)
+            rows = np.union1d(rows, grid_index.cap(grid_index.query(viewport),
+                                                   data.get('viewport_max_points', DEFAULT_VIEWPORT_MAX_POINTS)))
+        print('DEBUG: {} sampled points, viewport {}'.format(len(rows), viewport))
+    elif render_mode in ('density', 'viewport'):
+        grid_index = utils.get_grid_index(dataset, x_axis_key, y_axis_key)
+        rows = grid_index.query(viewport)
+        print('DEBUG: {} points in the viewport {}'.format(len(rows), viewport))
+        if render_mode == 'viewport':
+            rows = grid_index.cap(rows, data.get('viewport_max_points', DEFAULT_VIEWPORT_MAX_POINTS))
+    show_density = render_mode == 'density' and len(rows) > data.get('density_max_points',
+                                                                      DEFAULT_DENSITY_MAX_POINTS)
+
+    colourscale = 'Viridis' if colourscale_name is None or colourscale_name == '' else colourscale_name
+    precision = data.get('figure_precision', utils.DEFAULT_FIGURE_PRECISION)
+    slider_scale = data.get('slider_scale', 'linear')
+
+    # only the marker sizes or colours changed: update just them in the figure of the browser
+    if Patch is not None and not data.get('follow') and triggered and \
+            triggered <= MARKER_SIZE_INPUTS | MARKER_COLOUR_INPUTS:
+        if show_density:
+            # the heatmap does not depend on the markers
+            raise PreventUpdate
 
-    try:
-        # setting linear scale between the limits and flat below and above
-        for idx, size_new_i in enumerate(size_new):
-            if size_new_i < size_new_lower:
-                size_new[idx] = marker_size_range[0]
-            elif size_new_i > size_new_upper:
-                size_new[idx] = marker_size_range[1]
-            else:
-                size_new[idx] = utils.get_new_sizes(size_new_i, [size_new_lower, size_new_upper],
-                                                    marker_size_range)
-    except:
-        print('Error in scaling marker sizes. Using `30` for all data points instead.')
-        size_new = np.asarray([30] * len(size_new))
+        print('DEBUG: partial update of the graph on {}'.format(sorted(triggered)))
+        patch = Patch()
+        if triggered & MARKER_SIZE_INPUTS:
+            patch['data'][0]['marker']['size'] = utils.encode_marker_sizes(
+                get_marker_size(dataset, marker_size_key, marker_size_limits, marker_size_range, rows, slider_scale),
+                precision)
+        if triggered & MARKER_COLOUR_INPUTS:
+            color_new, meta, cmin, cmax = get_marker_colour(dataset, marker_colour_key, marker_colour_limits, rows,
+                                                            slider_scale)
+            patch['data'][0]['marker']['color'] = utils.encode_figure_array(color_new, precision)
+            patch['data'][0]['marker']['colorbar']['title']['text'] = dataframe.columns.tolist()[marker_colour_key]
+            patch['data'][0]['marker']['cmin'] = cmin
+            patch['data'][0]['marker']['cmax'] = cmax
+            patch['data'][0]['meta'] = meta
+        return patch
+
+    meta = {'n_rows': len(dataframe)}
+    if data.get('follow'):
+        meta.update(n_appended=0, limits=get_marker_limits(dataset, marker_size_key, marker_colour_key,
+                                                           marker_size_limits, slider_scale))
+
+    traces = []
+    if show_density:
+        traces.append(get_density_trace(data, x_new[rows], y_new[rows], viewport, colourscale, precision))
+    else:
+        if rows is not None:
+            x_new, y_new = x_new[rows], y_new[rows]
 
-    try:
-        list_hovertexts = data['list_hovertexts']
-    except KeyError:
-        list_hovertexts = []
+        traces.append(get_marker_trace(data, dataset, x_new, y_new, marker_size_key, marker_colour_key,
+                                       marker_size_range, marker_size_limits, marker_colour_limits,
+                                       marker_opacity_value, colourscale, precision, rows))
 
-    try:
-        if data['webgl']:
-            scatter = go.Scattergl
-        else:
-            scatter = go.Scatter
-    except KeyError:
-        # by default skip the usage of WebGl
-        print("DEBUG: update_graph() failed to access data['webgl'], so not using WebGl")
-        scatter = go.Scatter
+    if render_mode == 'viewport':
+        traces.append(get_summary_trace(grid_index, viewport, precision))
 
     graph_data = {
-        'data': [scatter(
-            x=dataframe[dataframe.columns.tolist()[x_axis_key]].tolist(),
-            y=dataframe[dataframe.columns.tolist()[y_axis_key]].tolist(),
-            mode='markers',
-            hovertext=list_hovertexts,
-            marker={
-                'color': color_new,
-                'colorscale': 'Viridis' if colourscale_name is None or colourscale_name == '' else colourscale_name,
-                'size': size_new,
-                'colorbar': {'title': dataframe.columns.tolist()[marker_colour_key]},
-                'opacity': marker_opacity_value,
-                'cmin': color_new_lower,
-                'cmax': color_new_upper,
-                'line': {
-                    'color': 'rgb(0, 116, 217)',
-                    'width': 0.5
-                }},
-
-            name='TODO',
-        )],
+        'data': traces,
         'layout': go.Layout(hovermode='closest',
                             #         title = 'Data Visualization'
                             xaxis={'zeroline': False, 'showgrid': False, 'ticks': 'outside', 'automargin': True,
@@ -235,13 +296,399 @@ def update_graph(data, x_axis_key, y_axis_key, marker_size_key, marker_colour_ke
                                    'showline': True, 'mirror': True,
                                    'title': dataframe.columns.tolist()[y_axis_key]},
                             height=data['styles']['height_graph'],
+                            # keeps the zoom of the user while re-rendering, until the axes change
+                            uirevision='{}-{}-{}'.format(data.get('dataset_id'), x_axis_key, y_axis_key),
+                            meta=meta,
                             )
     }
 
     return graph_data
 
 
-def update_3d_viewer_on_hover(hover_data_dict, data, periodic_repetition_str):
+def follow_file(follow_state, data, x_axis_key, y_axis_key, marker_size_key, marker_colour_key, marker_size_range,
+                marker_size_limits, marker_colour_limits, marker_opacity_value, colourscale_name, relayout_data=None):
+    """
+    Reads the frames appended to a followed file (see `utils.read_new_frames()`) and adds the points not in the
+    figure of the browser yet, on every tick of the `interval-follow` component.
+
+    `follow_state` is the number of rows of the dataset in the figure of the browser, copied from the meta of its
+    layout by the clientside callback `frontend.clientside.FOLLOW_FIGURE_ROWS`, with the number of traces appended
+    and the limits of the marker sizes and colours. In markers mode the new points are appended to the figure with a
+    `dash.Patch` as a trace of their own, so the data sent is proportional to the new points; reading them is not,
+    see `utils.read_new_frames()`. The whole figure is constructed again, as one trace, once `FOLLOW_MAX_TRACES`
+    traces were appended or when the new rows changed the limits (see `get_marker_limits()`), so all the points are
+    sized and coloured alike; and always with the other render modes and sampling, which depend on all points. With
+    the quantile slider scale the limits are percentiles of all rows, which change with every append, so the whole
+    figure is sent on every tick with new frames.
+
+    Default decorator:
+    @app.callback(Output('store-graph-figure', 'data', allow_duplicate=True),
+              [Input('store-follow', 'data')],
+              [State('app-memory', 'data'),
+               State('dropdown-x-axis', 'value'),
+               State('dropdown-y-axis', 'value'),
+               State('dropdown-marker-size', 'value'),
+               State('dropdown-marker-colour', 'value'),
+               State('slider_marker_size_range', 'value'),
+               State('slider_marker_size_limits', 'value'),
+               State('slider_marker_color_limits', 'value'),
+               State('input-marker-opacity', 'value'),
+               State('input-colourscale', 'value'),
+               State('graph', 'relayoutData')],
+              prevent_initial_call=True)
+    """
+    if not follow_state or follow_state.get('n_rows') is None or not data.get('follow'):
+        raise PreventUpdate
+
+    try:
+        utils.read_new_frames(data)
+        dataset = utils.get_dataset(data)
+    except KeyError:
+        raise PreventUpdate
+
+    n_rows, n_shown = len(dataset['df']), follow_state['n_rows']
+    if n_rows <= n_shown:
+        raise PreventUpdate
+
+    slider_scale = data.get('slider_scale', 'linear')
+    if data.get('render_mode', 'markers') != 'markers' or data.get('sampling') or \
+            follow_state.get('n_appended', 0) >= FOLLOW_MAX_TRACES or \
+            follow_state.get('limits') != get_marker_limits(dataset, marker_size_key, marker_colour_key,
+                                                            marker_size_limits, slider_scale):
+        return update_graph(data, x_axis_key, y_axis_key, marker_size_key, marker_colour_key, marker_size_range,
+                            marker_size_limits, marker_colour_limits, marker_opacity_value, colourscale_name,
+                            relayout_data)
+
+    rows = np.arange(n_shown, n_rows)
+    colourscale = 'Viridis' if colourscale_name is None or colourscale_name == '' else colourscale_name
+    trace = get_marker_trace(data, dataset, utils.get_column(dataset, x_axis_key)[rows],
+                             utils.get_column(dataset, y_axis_key)[rows], marker_size_key, marker_colour_key,
+                             marker_size_range, marker_size_limits, marker_colour_limits,
+                             utils.process_marker_opacity_value(marker_opacity_value), colourscale,
+                             data.get('figure_precision', utils.DEFAULT_FIGURE_PRECISION), rows)
+    trace['marker']['showscale'] = False
+    trace['showlegend'] = False
+
+    patch = Patch()
+    patch['data'].append(trace)
+    patch['layout']['meta']['n_rows'] = n_rows
+    patch['layout']['meta']['n_appended'] = follow_state.get('n_appended', 0) + 1
+    patch['layout']['showlegend'] = False
+
+    return patch
+
+
+def get_marker_limits(dataset, marker_size_key, marker_colour_key, marker_size_limits, scale='linear'):
+    """
+    Limits the marker sizes and colours of all points depend on: the limits of the size column and the range (and
+    quantile table) of the colour column, which change when rows are appended to a followed file.
+
+    :return: list of numbers, as it is read back from the meta of the figure (NaN as None)
+    """
+    summary = utils.get_column_summary(dataset, marker_colour_key)
+    limits = list(utils.get_column_limits(dataset, marker_size_key, marker_size_limits, scale)) + \
+        [summary['min'], summary['max']]
+    if scale == 'quantile':
+        limits += list(summary['quantiles'])
+
+    return [None if np.isnan(value) else float(value) for value in limits]
+
+
+def get_marker_trace(data, dataset, x, y, marker_size_key, marker_colour_key, marker_size_range, marker_size_limits,
+                     marker_colour_limits, marker_opacity_value, colourscale, precision, rows=None):
+    """
+    Scatter trace of the points at `rows` (all of them if None), coloured and sized by the columns.
+
+    :param x: (len(rows),) x coordinates of the points
+    :param y: (len(rows),) y coordinates of the points
+    """
+    dataframe = dataset['df']
+    slider_scale = data.get('slider_scale', 'linear')
+
+    color_new, meta, color_new_lower, color_new_upper = get_marker_colour(dataset, marker_colour_key,
+                                                                          marker_colour_limits, rows, slider_scale)
+    size_new = get_marker_size(dataset, marker_size_key, marker_size_limits, marker_size_range, rows, slider_scale)
+
+    # hover: the points are identified by their row index, the rest is resolved on demand
+    customdata, hovertemplate = get_hover_customdata(data, dataset, rows)
+
+    try:
+        if data['webgl']:
+            scatter = go.Scattergl
+        else:
+            scatter = go.Scatter
+    except KeyError:
+        # by default skip the usage of WebGl
+        print("DEBUG: get_marker_trace() failed to access data['webgl'], so not using WebGl")
+        scatter = go.Scatter
+
+    # the large arrays are set on the plain trace dictionary, as typed arrays unless set otherwise
+    trace = scatter(
+        mode='markers',
+        hovertemplate=hovertemplate,
+        marker={
+            'colorscale': colourscale,
+            'colorbar': {'title': dataframe.columns.tolist()[marker_colour_key]},
+            'opacity': marker_opacity_value,
+            'cmin': color_new_lower,
+            'cmax': color_new_upper,
+            'line': {
+                'color': 'rgb(0, 116, 217)',
+                'width': 0.5
+            }},
+
+        name='TODO',
+    ).to_plotly_json()
+    trace['x'] = utils.encode_figure_array(x, precision)
+    trace['y'] = utils.encode_figure_array(y, precision)
+    if customdata is not None:
+        trace['customdata'] = utils.encode_figure_array(customdata, precision)
+    trace['marker']['color'] = utils.encode_figure_array(color_new, precision)
+    trace['marker']['size'] = utils.encode_marker_sizes(size_new, precision)
+    trace['meta'] = meta
+
+    return trace
+
+
+def get_marker_colour(dataset, marker_colour_key, marker_colour_limits, rows=None, scale='linear'):
+    """
+    Colours of the markers and their limits, from the statistics of the colour column computed at load time.
+
+    :param marker_colour_limits: [lower, upper] percentages of the range of the colour column, or percentiles of it
+        with `scale='quantile'`, see `utils.get_column_limits()`
+    :param rows: rows of the points shown, None for all
+    :return: colours, meta of the trace with the range of the colour column (for the clientside styling), cmin, cmax
+    """
+    color_new = utils.get_column(dataset, marker_colour_key)
+    color_new_lower, color_new_upper = utils.get_column_limits(dataset, marker_colour_key, marker_colour_limits,
+                                                               scale)
+
+    summary = utils.get_column_summary(dataset, marker_colour_key)
+    meta = {'style': 'colour', 'colour_min': float(summary['min']), 'colour_max': float(summary['max'])}
+    if scale == 'quantile':
+        meta['colour_quantiles'] = summary['quantiles'].tolist()
+
+    if rows is not None:
+        color_new = color_new[rows]
+
+    return color_new, meta, color_new_lower, color_new_upper
+
+
+def get_marker_size(dataset, marker_size_key, marker_size_limits, marker_size_range, rows=None, scale='linear'):
+    """
+    Sizes of the markers, linear in the size column between the limits and flat below and above, see
+    `utils.get_new_sizes()`, of the points at `rows` or of all if None.
+
+    :param marker_size_limits: [lower, upper] limits, see `utils.get_column_limits()`
+    :param marker_size_range: [smallest, largest] marker size
+    """
+    values = utils.get_column(dataset, marker_size_key)
+    if rows is not None:
+        values = values[rows]
+
+    return utils.get_new_sizes(values, utils.get_column_limits(dataset, marker_size_key, marker_size_limits, scale),
+                               marker_size_range)
+
+
+def get_density_trace(data, x, y, viewport, colourscale, precision):
+    """
+    Heatmap of the number of points per bin over the viewport, at about `data['density_bin_px']` pixels per bin of
+    the graph. The colour is the decimal logarithm of the count, empty bins are left transparent.
+
+    The bins carry no rows, clicking and hovering on them is resolved to the nearest point on the server, see
+    `resolve_point_row_index()`.
+
+    :param x: x coordinates of the points in the viewport
+    :param y: y coordinates of the points in the viewport
+    :param viewport: (x_range, y_range), see `spatial.parse_viewport()`
+    """
+    bin_px = data.get('density_bin_px', DEFAULT_DENSITY_BIN_PX)
+    height = data['styles']['height_graph']
+    width = data['styles'].get('width_graph', height)
+    shape = (max(1, int(height) // bin_px), max(1, int(width) // bin_px))
+
+    x_range = spatial.get_extent(x, viewport[0])
+    y_range = spatial.get_extent(y, viewport[1])
+    counts, x_centres, y_centres = spatial.rasterize(x, y, x_range, y_range, shape)
+
+    with np.errstate(divide='ignore'):
+        z = np.where(counts > 0, np.log10(counts), np.nan)
+
+    trace = go.Heatmap(
+        colorscale=colourscale,
+        colorbar={'title': 'log10(points per bin)'},
+        hoverongaps=False,
+        hovertemplate='x: %{x}<br>y: %{y}<br>log10(count): %{z:.2f}<extra></extra>',
+        name='density',
+        meta={'style': 'density'},
+    ).to_plotly_json()
+    trace['x'] = utils.encode_figure_array(x_centres, precision)
+    trace['y'] = utils.encode_figure_array(y_centres, precision)
+    if precision == 'json':
+        trace['z'] = [[None if np.isnan(v) else v for v in row] for row in z.tolist()]
+    else:
+        trace['z'] = utils.encode_figure_array(z, precision)
+
+    return trace
+
+
+def get_summary_trace(grid_index, viewport, precision):
+    """
+    Small grey markers at the centroids of the non-empty cells of the grid index outside of the viewport, so panning
+    shows where the rest of the points are before the viewport is refreshed. They take no hover or click events.
+    """
+    x, y, counts = grid_index.summary_outside(viewport)
+
+    trace = go.Scattergl(
+        mode='markers',
+        hoverinfo='skip',
+        showlegend=False,
+        marker={'color': 'rgb(180, 180, 180)', 'size': 4, 'opacity': 0.5},
+        name='outside of the view',
+    ).to_plotly_json()
+    trace['x'] = utils.encode_figure_array(x, precision)
+    trace['y'] = utils.encode_figure_array(y, precision)
+
+    return trace
+
+
+def get_triggered_prop_ids():
+    """The `id.property` strings of the inputs that triggered the callback, empty outside of a callback"""
+    try:
+        return {t['prop_id'] for t in callback_context.triggered}
+    except Exception:
+        return set()
+
+
+def get_hover_customdata(data, dataset, rows=None):
+    """
+    Constructs the `customdata` and `hovertemplate` of the scatter trace, depending on `data['hover_mode']`:
+        'panel': (default) the values of the hover columns are shown in the detail panel by `update_hover_info()`;
+                 the points are identified by their point number, which is their row index, so there is no customdata
+        'tooltip': the row index and the values of the hover columns are sent with the points and are shown in the
+                   tooltip by plotly.js
+
+    The hover columns are `data['hover_columns']`, see `utils.get_hover_columns()`.
+
+    If only the points at `rows` are shown, their point numbers are not their row indices any more, so the rows are
+    sent as customdata in the 'panel' mode as well.
+    """
+    if data.get('hover_mode', 'panel') != 'tooltip':
+        if rows is not None:
+            return rows, 'point %{customdata}<br>x: %{x}<br>y: %{y}<extra></extra>'
+        return None, 'point %{pointNumber}<br>x: %{x}<br>y: %{y}<extra></extra>'
+
+    if rows is None:
+        rows = np.arange(len(dataset['df']))
+    hover_columns = utils.get_hover_columns(dataset['df'].columns, data.get('hover_columns'))
+    customdata = np.empty((len(rows), len(hover_columns) + 1), dtype=object)
+    customdata[:, 0] = rows
+    for i, c in enumerate(hover_columns):
+        customdata[:, i + 1] = utils.get_column(dataset, c)[rows]
+
+    hovertemplate = '<br>'.join(['point %{customdata[0]}'] +
+                                ['{}: %{{customdata[{}]}}'.format(c, i + 1) for i, c in enumerate(hover_columns)])
+
+    return customdata, hovertemplate + '<extra></extra>'
+
+
+def get_point_row_index(point):
+    """
+    Row of the dataframe of a point of a hover or click event, from its `customdata` (see `get_hover_customdata()`)
+    with the point number as a fallback.
+    """
+    customdata = point.get('customdata')
+    if customdata is None:
+        return point['pointNumber']
+    if isinstance(customdata, list):
+        return int(customdata[0])
+    return int(customdata)
+
+
+def resolve_point_row_index(point, dataset, x_axis_key=None, y_axis_key=None):
+    """
+    Row of the dataframe of a point of a hover or click event.
+
+    Points of an aggregated trace, like the bins of the density heatmap, are not rows of the dataframe; they are
+    resolved to the row nearest to their coordinates with the KD-tree of the projection onto the axis columns.
+    Otherwise `get_point_row_index()` is used.
+
+    :raises PreventUpdate: if an aggregated point cannot be resolved without the axis columns
+    """
+    if point.get('customdata') is None and isinstance(point.get('pointNumber'), list):
+        if x_axis_key is None or y_axis_key is None:
+            raise PreventUpdate
+        return utils.get_point_index(dataset, x_axis_key, y_axis_key).nearest(point['x'], point['y'])
+
+    return get_point_row_index(point)
+
+
+def update_hover_info(hover_data_dict, data, x_axis_key=None, y_axis_key=None):
+    """
+    Shows the values of the hover columns of the hovered point in the detail panel.
+
+    Default decorator:
+    @app.callback(Output('markdown-hover-info', 'children'),
+              [Input('graph', 'hoverData')],
+              [State('app-memory', 'data'),
+               State('dropdown-x-axis', 'value'),
+               State('dropdown-y-axis', 'value')])
+    """
+    if hover_data_dict is None:
+        raise PreventUpdate
+
+    try:
+        dataset = utils.get_dataset(data)
+    except KeyError:
+        raise PreventUpdate
+
+    row_index = resolve_point_row_index(hover_data_dict['points'][0], dataset, x_axis_key, y_axis_key)
+    hover_columns = utils.get_hover_columns(dataset['df'].columns, data.get('hover_columns'))
+
+    return utils.get_hoverinfo_text(dataset['df'], row_index, hover_columns)
+
+
+def update_selection_info(selected_data, data, x_axis_key, y_axis_key):
+    """
+    Summarises the points of a box or lasso selection of the graph in the selection panel: their number, the number
+    of systems they belong to and the range and mean of the numeric hover columns.
+
+    The selection is resolved on the server with the KD-tree of the projection, see `spatial.PointIndex.select()`, so
+    it is complete even if the points are aggregated or culled in the browser.
+
+    Default decorator:
+    @app.callback(Output('markdown-selection-info', 'children'),
+              [Input('graph', 'selectedData')],
+              [State('app-memory', 'data'),
+               State('dropdown-x-axis', 'value'),
+               State('dropdown-y-axis', 'value')])
+    """
+    try:
+        dataset = utils.get_dataset(data)
+    except KeyError:
+        raise PreventUpdate
+
+    if x_axis_key is None or y_axis_key is None:
+        raise PreventUpdate
+
+    rows = utils.get_point_index(dataset, x_axis_key, y_axis_key).select(selected_data)
+    if rows is None:
+        return ''
+
+    lines = ['**{} points selected** in {} systems'.format(len(rows),
+                                                             len(np.unique(dataset['system_index'][rows])))]
+    if len(rows):
+        for c in utils.get_hover_columns(dataset['df'].columns, data.get('hover_columns')):
+            values = utils.get_column(dataset, c)
+            if np.issubdtype(values.dtype, np.number):
+                values = values[rows]
+                lines.append('{}: {:.6g} to {:.6g}, mean {:.6g}'.format(c, np.min(values), np.max(values),
+                                                                        np.mean(values)))
+
+    return '  \n'.join(lines)
+
+
+def update_3d_viewer_on_hover(hover_data_dict, data, periodic_repetition_str, x_axis_key=None, y_axis_key=None):
     """
     Update the visualiser on a hover event.
     If the event is None, then no change occurs.
@@ -253,8 +700,11 @@ def update_3d_viewer_on_hover(hover_data_dict, data, periodic_repetition_str):
     @app.callback(Output('div-3dviewer', 'children'),
               [Input('graph', 'clickData'),
                Input('app-memory', 'data'),
-               Input('input_periodic_repetition_structure', 'value')])
+               Input('input_periodic_repetition_structure', 'value')],
+              [State('dropdown-x-axis', 'value'),
+               State('dropdown-y-axis', 'value')])
 
+    The axis columns are needed for resolving clicks on aggregated traces, see `resolve_point_row_index()`.
 
     :param hover_data_dict:
     :param data:
@@ -280,8 +730,9 @@ def update_3d_viewer_on_hover(hover_data_dict, data, periodic_repetition_str):
 
             print('DEBUG update 3d viewer with dict: \n\t{}'.format(hover_data_dict))
             try:
-                point_index = hover_data_dict['points'][0]['pointNumber']
-            except TypeError:
+                point_index = resolve_point_row_index(hover_data_dict['points'][0], utils.get_dataset(data),
+                                                      x_axis_key, y_axis_key)
+            except (TypeError, KeyError):
                 point_index = 0
     else:
         print('DEBUG: update of 3d viewer prevented by callback_context.triggered=False')
@@ -321,8 +772,44 @@ def update_dropdown_options(data):
     # no options if the dataframe does not exist yet
     try:
         options = [{'label': '{}'.format(l), 'value': i} for i, l in
-                   enumerate(pd.read_json(data['df_json']).columns)]
+                   enumerate(utils.get_dataset(data)['df'].columns)]
     except KeyError:
         options = []
 
     return options, options, options, options
+
+
+def update_skipped_columns_options(data):
+    """
+    Lists the keys of the file skipped by the column filter of the dataset, for loading them on request.
+
+    Default decorator:
+    @app.callback(Output('dropdown-load-columns', 'options'),
+              [Input('app-memory', 'data')])
+    """
+    try:
+        skipped_keys = utils.get_dataset(data).get('skipped_keys') or []
+    except KeyError:
+        skipped_keys = []
+
+    return [{'label': k, 'value': k} for k in skipped_keys]
+
+
+def load_columns(n_clicks, keys, data):
+    """
+    Loads the chosen skipped keys into the feature table of the dataset, see `utils.load_columns()`. The new columns
+    are appended to the dropdown menus by the update of the app-data.
+
+    Default decorator:
+    @app.callback(Output('app-memory', 'data'),
+              [Input('button-load-columns', 'n_clicks')],
+              [State('dropdown-load-columns', 'value'),
+               State('app-memory', 'data')])
+    """
+    if not n_clicks or not keys:
+        raise PreventUpdate
+
+    try:
+        return utils.load_columns(data, keys)
+    except KeyError:
+        raise PreventUpdate
@@ -1,2 +1,3 @@
+import projection_viewer.frontend.clientside
 import projection_viewer.frontend.layouts
 import projection_viewer.frontend.visualiser
@@ -0,0 +1,98 @@
+"""
+Clientside (JavaScript) callbacks, run in the browser without a request to the server.
+"""
+
+# Applies the cosmetic settings of the graph onto the figure constructed by `callbacks.update_graph()`, so changing
+# them needs no server round-trip and no re-serialisation of the points. Only the traces marked in their `meta` are
+# styled: `{'style': 'colour', 'colour_min', 'colour_max'}` markers coloured by a column, whose colour limits are
+# percentages of this range, or percentiles interpolated in the quantile table `colour_quantiles` (101 values) when
+# given, and `{'style': 'density'}` heatmaps, which only take the colourscale.
+#
+# Default registration:
+# app.clientside_callback(frontend.clientside.APPLY_FIGURE_STYLE,
+#                         Output('graph', 'figure'),
+#                         [Input('store-graph-figure', 'data'),
+#                          Input('input-marker-opacity', 'value'),
+#                          Input('input-colourscale', 'value'),
+#                          Input('slider_marker_color_limits', 'value')])
+APPLY_FIGURE_STYLE = """
+function(figure, opacityValue, colourscaleName, colourLimits) {
+    if (!figure) {
+        return window.dash_clientside.no_update;
+    }
+
+    // same as utils.process_marker_opacity_value()
+    var opacity = parseFloat(opacityValue);
+    if (opacityValue === null || opacityValue === undefined || isNaN(opacity) || opacity < 0 || opacity > 1) {
+        opacity = 1.0;
+    }
+    var colourscale = colourscaleName ? colourscaleName : 'Viridis';
+    var limits = colourLimits ? colourLimits : [0, 100];
+
+    var data = figure.data.map(function(trace) {
+        var meta = trace.meta || {};
+        if (meta.style === 'density') {
+            return Object.assign({}, trace, {colorscale: colourscale});
+        }
+        if (meta.style !== 'colour') {
+            return trace;
+        }
+
+        // same as utils.get_column_limits()
+        var colourLimit = function(percent) {
+            var quantiles = meta.colour_quantiles;
+            if (!quantiles) {
+                return meta.colour_min + Math.abs(meta.colour_max - meta.colour_min) / 100. * percent;
+            }
+            var i = Math.min(Math.max(Math.floor(percent), 0), quantiles.length - 2);
+            return quantiles[i] + (quantiles[i + 1] - quantiles[i]) * (percent - i);
+        };
+        var marker = Object.assign({}, trace.marker, {
+            colorscale: colourscale,
+            opacity: opacity,
+            cmin: colourLimit(limits[0]),
+            cmax: colourLimit(limits[1])
+        });
+        return Object.assign({}, trace, {marker: marker});
+    });
+
+    return Object.assign({}, figure, {data: data});
+}
+"""
+
+# On every tick of the interval of a followed file, the number of rows of the dataset in the figure of the graph, the
+# number of traces appended and the limits of the markers, saved in the meta of its layout by
+# `callbacks.update_graph()` and `callbacks.follow_file()`, for the latter to append the points of the rows after it.
+# Reading the figure here costs no request, unlike sending it to the server as a State.
+#
+# Default registration:
+# app.clientside_callback(frontend.clientside.FOLLOW_FIGURE_ROWS,
+#                         Output('store-follow', 'data'),
+#                         [Input('interval-follow', 'n_intervals')],
+#                         [State('store-graph-figure', 'data')])
+FOLLOW_FIGURE_ROWS = """
+function(nIntervals, figure) {
+    if (!figure || !figure.layout || !figure.layout.meta) {
+        return window.dash_clientside.no_update;
+    }
+    var meta = figure.layout.meta;
+    return {n_rows: meta.n_rows, n_appended: meta.n_appended, limits: meta.limits, tick: nIntervals};
+}
+"""
+
+# Clears the relayout data of the graph when the projection changes: the graph is autoranged on new axes (see the
+# `uirevision` of the layout) without a relayout event, so the ranges zoomed into before no longer describe the
+# viewport, and `callbacks.update_graph()` would take them for it on the following marker updates.
+#
+# Default registration:
+# app.clientside_callback(frontend.clientside.RESET_VIEWPORT,
+#                         Output('graph', 'relayoutData'),
+#                         [Input('app-memory', 'data'),
+#                          Input('dropdown-x-axis', 'value'),
+#                          Input('dropdown-y-axis', 'value')],
+#                         prevent_initial_call=True)
+RESET_VIEWPORT = """
+function(data, xAxisKey, yAxisKey) {
+    return null;
+}
+"""
@@ -5,6 +5,7 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash import Dash
 
+from projection_viewer.sampling import DEFAULT_SAMPLE_POINTS
 from projection_viewer.utils import get_asset_folder, str2bool
 
 
@@ -176,7 +177,10 @@ def parse_config(config_filename):
     data = {}
     config = configparser.ConfigParser()
     config.read(config_filename)
+    # a file, a glob pattern or a comma separated list of them, see `utils.get_filenames()`
     data['extended_xyz_file'] = config['Basic']['extended_xyz_file']
+    if ',' in data['extended_xyz_file']:
+        data['extended_xyz_file'] = data['extended_xyz_file'].split(',')
     data['mode'] = config['Basic']['mode']
     data['soap_cutoff_radius'] = config['Basic']['soap_cutoff_radius']
     data['marker_radius'] = config['Basic']['marker_radius']
@@ -202,9 +206,56 @@ def parse_config(config_filename):
     data['styles']['width_viewer'] = int(config['Basic']['height_graph'])
     data['styles']['webgl'] = str2bool(config['Basic']['webgl'])
 
+    # hover and figure settings, optional
+    data['figure_precision'] = config['Basic'].get('figure_precision', 'float32')
+    data['hover_mode'] = config['Basic'].get('hover_mode', 'panel')
+    data['render_mode'] = config['Basic'].get('render_mode', 'markers')
+    data['density_max_points'] = int(config['Basic'].get('density_max_points', 100000))
+    data['viewport_max_points'] = int(config['Basic'].get('viewport_max_points', 200000))
+    data['slider_scale'] = config['Basic'].get('slider_scale', 'linear')
+    try:
+        data['hover_columns'] = config['Basic']['hover_columns'].split(',')
+    except KeyError:
+        data['hover_columns'] = None
+
+    # subsampling of the points in markers mode, optional, see `utils.get_sample_rows()`
+    try:
+        data['sampling'] = dict(method=config['Basic']['sampling'],
+                                n_points=int(config['Basic'].get('sample_points', DEFAULT_SAMPLE_POINTS)))
+    except KeyError:
+        data['sampling'] = None
+
+    # following a file that is being appended to, optional, see `utils.read_new_frames()`
+    data['follow'] = str2bool(config['Basic'].get('follow', 'False'))
+    data['follow_interval'] = float(config['Basic'].get('follow_interval', 2.0))
+
+    # columns loaded from the file, optional, see `utils.split_keys()`
+    data['column_filter'] = get_column_filter(config['Basic'].get('include_columns'),
+                                              config['Basic'].get('exclude_columns'),
+                                              config['Basic'].get('max_vector_width'))
+
+    # file the load report is appended to, optional, see `profiling.LoadReport`
+    data['load_report'] = config['Basic'].get('load_report')
+
     return data
 
 
+def get_column_filter(include_columns=None, exclude_columns=None, max_vector_width=None):
+    """
+    Column filter of `utils.load_xyz()` from comma separated lists of include and exclude patterns and the maximum
+    vector width, None if nothing is filtered.
+    """
+    column_filter = dict()
+    if include_columns:
+        column_filter['include'] = include_columns.split(',')
+    if exclude_columns:
+        column_filter['exclude'] = exclude_columns.split(',')
+    if max_vector_width is not None:
+        column_filter['max_vector_width'] = int(max_vector_width)
+
+    return column_filter or None
+
+
 # noinspection PyUnresolvedReferences
 def get_tab_layout_visualiser(data, store=True):
     # STYLE SETTINGS
@@ -254,7 +305,13 @@ def get_tab_layout_visualiser(data, store=True):
                                                   dcc.Input(
                                                       id='input-colourscale',
                                                       type='text',
-                                                      placeholder='colourscale')])
+                                                      placeholder='colourscale')]),
+                              # keys of the file skipped by the column filter, loaded on request
+                              html.Span(className='app__dropdown',
+                                        children=['load columns', html.Br(),
+                                                  dcc.Dropdown(id='dropdown-load-columns',
+                                                               style=const_style_dropdown, options=[], multi=True),
+                                                  html.Button('load', id='button-load-columns')])
                           ]),
 
                           # Controls: Sliders for colour and size limits
@@ -290,7 +347,17 @@ def get_tab_layout_visualiser(data, store=True):
 
                           # Graph: placeholder, filled on graph intialisation
                           html.Div(className='app__container_scatter', children=[
-                              dcc.Graph(id='graph', figure={'data': [], 'layout': {}})], ),
+                              dcc.Graph(id='graph', figure={'data': [], 'layout': {}}),
+                              # the figure from the server, styled in the browser before shown in the graph
+                              dcc.Store(id='store-graph-figure'),
+                              # polling of a followed file for appended frames, and the rows in the figure
+                              dcc.Interval(id='interval-follow', interval=1000 * float(data.get('follow_interval', 2)),
+                                           disabled=not data.get('follow', False)),
+                              dcc.Store(id='store-follow'),
+                              # detail panel of the hovered point, filled on hover
+                              dcc.Markdown(id='markdown-hover-info', className='app__remarks_viewer'),
+                              # summary of the box or lasso selection, filled on selection
+                              dcc.Markdown(id='markdown-selection-info', className='app__remarks_viewer')], ),
 
                           # 3D Viewer
                           # a main Div, with a dcc.Loading compontnt in it for loading of the viewer
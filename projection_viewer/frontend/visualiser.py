@@ -4,7 +4,7 @@ import numpy as np
 from ase.data import covalent_radii
 from ase.data.colors import jmol_colors
 
-from projection_viewer.utils import get_hex_color, json2atoms, make_periodic_ase_at, ase2json
+from projection_viewer.utils import get_dataset, get_hex_color, make_periodic_ase_at, ase2json
 
 
 def get_style_config_dict(title='Example', height_viewer=500, width_viewer=500, height_graph=500, **kwargs):
@@ -88,16 +88,20 @@ def return_atom_list_style_for_3d_view(ase_atoms):
 
 
 def construct_3d_view_data(data, point_index, periodic_repetition_str, skip_soap=False):
+    # the dataset is looked up on the server side, only its id is sent by the browser
+    dataset = get_dataset(data)
+
     # get the ids to specify the atom in the atoms_list
-    config_id = data['system_index'][point_index]
+    config_id = dataset['system_index'][point_index]
 
     if data['mode'] == 'atomic':
-        atom_in_conifg_id = data['atom_index_in_systems'][point_index]
+        atom_in_conifg_id = dataset['atom_index_in_systems'][point_index]
     else:
         atom_in_conifg_id = None
 
-    at_json = data['atoms_list_json'][config_id]
-    at_ase = json2atoms(at_json)
+    # only the requested geometry is constructed, centred on its CoM like the model data of the viewer
+    at_ase = dataset['structures'].get_atoms(config_id)
+    at_ase.translate(-at_ase.get_center_of_mass())
     at_ase = make_periodic_ase_at(at_ase, periodic_repetition_str)
 
     # soap spheres and cell frame
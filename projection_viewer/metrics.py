@@ -0,0 +1,196 @@
+"""
+Latency, payload and error metrics of the Dash callbacks, exposed in the Prometheus text format.
+
+`instrument_app()` wraps the callback endpoint of the Flask server of the app (`_dash-update-component`): every
+request is attributed to the callback of its output, and its latency (including the decoding of the request and the
+serialisation of the response), the sizes of the request and of the response and its outcome are recorded. Requests
+that fail are counted as errors and ones raising `PreventUpdate` as prevented. The metrics are served on `/metrics`,
+along with the counters of the dataset registry and the memory of the server process.
+"""
+
+import threading
+import time
+
+import flask
+
+from projection_viewer import profiling
+from projection_viewer.registry import registry as dataset_registry
+
+# upper bounds of the buckets of the histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+PAYLOAD_BUCKETS = (1e3, 1e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7, 1e8)
+
+PREFIX = 'projection_viewer'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, like a Prometheus histogram, not thread-safe by itself"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class CallbackMetrics:
+    """Histograms of the latency and the payload sizes, and the number of errors of each callback"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = dict()
+
+    def observe(self, callback, latency, request_bytes, response_bytes, status='ok'):
+        """
+        Records one request of `callback`.
+
+        :param status: 'ok', 'prevented' (PreventUpdate) or 'error'
+        """
+        with self._lock:
+            if callback not in self._callbacks:
+                self._callbacks[callback] = dict(latency=Histogram(LATENCY_BUCKETS),
+                                                 request_bytes=Histogram(PAYLOAD_BUCKETS),
+                                                 response_bytes=Histogram(PAYLOAD_BUCKETS),
+                                                 prevented=0, errors=0)
+            entry = self._callbacks[callback]
+            entry['latency'].observe(latency)
+            entry['request_bytes'].observe(request_bytes)
+            entry['response_bytes'].observe(response_bytes)
+            if status == 'prevented':
+                entry['prevented'] += 1
+            elif status == 'error':
+                entry['errors'] += 1
+
+    def get_stats(self):
+        """Number of requests, errors and the mean latency of each callback"""
+        with self._lock:
+            return {name: dict(count=entry['latency'].count, errors=entry['errors'], prevented=entry['prevented'],
+                               mean_latency=entry['latency'].sum / max(entry['latency'].count, 1))
+                    for name, entry in self._callbacks.items()}
+
+    def to_prometheus(self):
+        """The metrics of the callbacks in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            callbacks = sorted(self._callbacks.items())
+
+            for key, unit, description in [('latency', 'seconds', 'Latency of the callback requests'),
+                                           ('request_bytes', '', 'Size of the callback requests'),
+                                           ('response_bytes', '', 'Size of the callback responses')]:
+                name = '{}_callback_{}'.format(PREFIX, key if not unit else 'duration_' + unit)
+                lines += ['# HELP {} {}'.format(name, description), '# TYPE {} histogram'.format(name)]
+                for callback, entry in callbacks:
+                    histogram = entry[key]
+                    label = 'callback="{}"'.format(_escape(callback))
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label, _format_value(bound), count))
+                    lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(name, label, histogram.count))
+                    lines.append('{}_sum{{{}}} {}'.format(name, label, _format_value(histogram.sum)))
+                    lines.append('{}_count{{{}}} {}'.format(name, label, histogram.count))
+
+            for key, description in [('errors', 'Callback requests that failed'),
+                                     ('prevented', 'Callback requests that raised PreventUpdate')]:
+                name = '{}_callback_{}_total'.format(PREFIX, key)
+                lines += ['# HELP {} {}'.format(name, description), '# TYPE {} counter'.format(name)]
+                for callback, entry in callbacks:
+                    lines.append('{}{{callback="{}"}} {}'.format(name, _escape(callback), entry[key]))
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._callbacks.clear()
+
+
+def _escape(value):
+    """Label value of the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    return repr(float(value))
+
+
+def get_registry_metrics(registry=dataset_registry):
+    """The counters of the dataset registry and the memory of the process in the Prometheus text format"""
+    stats = registry.get_stats()
+    lines = []
+    for key, kind, description in [('size', 'gauge', 'Datasets in the registry'),
+                                   ('max_size', 'gauge', 'Largest number of datasets kept in the registry'),
+                                   ('hits', 'counter', 'Dataset lookups served from the registry'),
+                                   ('misses', 'counter', 'Dataset lookups of datasets not in the registry'),
+                                   ('evictions', 'counter', 'Datasets evicted from the registry'),
+                                   ('columns', 'gauge', 'Memoized columns'),
+                                   ('column_hits', 'counter', 'Column lookups served from the memoized ones'),
+                                   ('column_misses', 'counter', 'Column lookups converting the column'),
+                                   ('derived', 'gauge', 'Memoized derived structures, e.g. spatial indices')]:
+        name = '{}_registry_{}{}'.format(PREFIX, key, '_total' if kind == 'counter' else '')
+        lines += ['# HELP {} {}'.format(name, description), '# TYPE {} {}'.format(name, kind),
+                  '{} {}'.format(name, stats[key])]
+
+    rss = profiling.get_current_rss()
+    if rss is not None:
+        name = '{}_process_resident_memory_bytes'.format(PREFIX)
+        lines += ['# HELP {} Resident memory of the server process'.format(name), '# TYPE {} gauge'.format(name),
+                  '{} {}'.format(name, rss)]
+
+    return '\n'.join(lines) + '\n'
+
+
+def get_callback_name(app, output):
+    """Name of the function of the callback of `output` (the output string of the request), or the output itself"""
+    callback = app.callback_map.get(output, dict()).get('callback')
+    return getattr(callback, '__name__', None) or output
+
+
+def instrument_app(app, metrics=None, route='/metrics'):
+    """
+    Records the metrics of the callback requests of the Dash app and serves them on `route` of its Flask server.
+
+    :param app: dash.Dash, after or before its callbacks are registered
+    :param metrics: CallbackMetrics, a new one if None
+    :return: the CallbackMetrics
+    """
+    if metrics is None:
+        metrics = CallbackMetrics()
+    server = app.server
+
+    def is_callback_request():
+        return flask.request.path.endswith('/_dash-update-component')
+
+    @server.before_request
+    def start_callback_timer():
+        if is_callback_request():
+            flask.g.callback_start_time = time.perf_counter()
+
+    @server.after_request
+    def record_callback_metrics(response):
+        start_time = flask.g.pop('callback_start_time', None)
+        if start_time is None:
+            return response
+
+        body = flask.request.get_json(silent=True) or dict()
+        if response.status_code == 204:
+            status = 'prevented'
+        elif response.status_code >= 400:
+            status = 'error'
+        else:
+            status = 'ok'
+        response_bytes = response.calculate_content_length()
+        metrics.observe(get_callback_name(app, body.get('output')), time.perf_counter() - start_time,
+                        flask.request.content_length or 0, response_bytes or 0, status=status)
+        return response
+
+    @server.route(route)
+    def prometheus_metrics():
+        return flask.Response(metrics.to_prometheus() + get_registry_metrics(), content_type=CONTENT_TYPE)
+
+    return metrics
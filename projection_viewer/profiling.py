@@ -0,0 +1,121 @@
+"""
+Per-stage timing and memory report of loading a dataset, see `utils.load_xyz()`.
+
+Every stage records its wall time, the change of the resident memory (RSS) of the process and the increase of its
+peak RSS, along with the size of what it produced: rows and columns of the feature table and bytes (of the table in
+memory, or of the file read or written). The RSS is of the current process only, the memory of worker processes, e.g.
+of parallel parsing, is not included.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the memory is not reported there
+    resource = None
+
+
+def get_current_rss():
+    """Resident memory of the process in bytes, None if it cannot be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_peak_rss():
+    """Peak resident memory of the process in bytes, None if it cannot be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _difference(after, before):
+    return None if after is None or before is None else after - before
+
+
+def get_table_size(dataframe):
+    """Rows, columns and bytes in memory of a feature table, the fields of a stage"""
+    return dict(rows=len(dataframe), columns=len(dataframe.columns),
+                bytes=int(dataframe.memory_usage(deep=True).sum()))
+
+
+class LoadReport:
+    """
+    Stages of loading a dataset, in the order they ran.
+
+    Use:
+        report = LoadReport()
+        with report.stage('parse') as record:
+            atoms_list = ase.io.read(filename, ':')
+            record.update(rows=len(atoms_list), bytes=os.path.getsize(filename))
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._start_time = time.perf_counter()
+        self._start_rss = get_current_rss()
+        self._start_peak_rss = get_peak_rss()
+
+    @contextmanager
+    def stage(self, name):
+        """Measures the stage run inside the `with` block, the dict yielded takes `rows`, `columns` and `bytes`"""
+        record = dict(stage=name, rows=None, columns=None, bytes=None)
+        rss, peak_rss = get_current_rss(), get_peak_rss()
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['time'] = time.perf_counter() - t0
+            record['rss_delta'] = _difference(get_current_rss(), rss)
+            record['peak_rss_increase'] = _difference(get_peak_rss(), peak_rss)
+            self.stages.append(record)
+
+    def to_dict(self, **info):
+        """The report as a JSON serialisable dict, with the totals since its construction and `info`"""
+        report = dict(info)
+        report['time'] = time.perf_counter() - self._start_time
+        report['rss_delta'] = _difference(get_current_rss(), self._start_rss)
+        report['peak_rss_increase'] = _difference(get_peak_rss(), self._start_peak_rss)
+        report['stages'] = [dict(record) for record in self.stages]
+        return report
+
+
+@contextmanager
+def stage(report, name):
+    """`report.stage(name)`, or only a dict for the fields when `report` is None"""
+    if report is None:
+        yield dict()
+    else:
+        with report.stage(name) as record:
+            yield record
+
+
+def _format_mb(value):
+    return '{:9.1f} MB'.format(value / 1e6) if value is not None else '{:>12}'.format('-')
+
+
+def format_load_report(report):
+    """Text of a report of `LoadReport.to_dict()`: one line per stage and the total"""
+    lines = ['Load report of {}: {:.3f} s, peak RSS +{}'.format(report.get('file'), report['time'],
+                                                              _format_mb(report['peak_rss_increase']).strip())]
+    for record in report['stages']:
+        lines.append('    {:<14} {:8.3f} s  RSS {} peak +{}  {:>9} rows {:>6} columns {}'.format(
+            record['stage'], record['time'], _format_mb(record['rss_delta']), _format_mb(record['peak_rss_increase']),
+            '-' if record['rows'] is None else record['rows'],
+            '-' if record['columns'] is None else record['columns'], _format_mb(record['bytes'])))
+    return '\n'.join(lines)
+
+
+def write_load_report(report, filename):
+    """Appends the report as one line of JSON to `filename`, to follow the load times across runs and datasets"""
+    with open(filename, 'a') as f:
+        f.write(json.dumps(report) + '\n')
@@ -0,0 +1,165 @@
+"""
+In-process registry of the loaded datasets.
+
+The browser side `app-memory` store only holds the id of the dataset, the callbacks look the dataset itself up here,
+so the feature table and the geometries never travel between the browser and the server. The columns of the feature
+table used by the callbacks are memoized as NumPy arrays, shared by all callbacks and sessions, and so are the
+structures derived from them, like the spatial indices of the projections.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+class DatasetRegistry:
+    """
+    Datasets by id, with least recently used eviction once more than `max_size` datasets are registered.
+
+    The number of lookups served from memory (hits) and failed ones (misses) are counted for monitoring, see
+    `get_stats()`.
+    """
+
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self._datasets = OrderedDict()
+        self._columns = dict()
+        self._derived = dict()
+        self._lock = threading.Lock()
+
+        # generation of each registered dataset, changed whenever its memoized values are dropped, so values computed
+        # outside the lock from an older state of the dataset are not memoized
+        self._generation = 0
+        self._generations = dict()
+
+        # counters for monitoring
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.column_hits = 0
+        self.column_misses = 0
+
+    def register(self, dataset_id, dataset):
+        """Adds the dataset under `dataset_id`, evicting the least recently used ones if needed"""
+        with self._lock:
+            self._datasets[dataset_id] = dataset
+            self._datasets.move_to_end(dataset_id)
+            self._drop_memoized(dataset_id)
+            while len(self._datasets) > self.max_size:
+                evicted_id, _ = self._datasets.popitem(last=False)
+                self._drop_memoized(evicted_id)
+                self.evictions += 1
+                print('DEBUG: dataset {} evicted from the registry'.format(evicted_id))
+
+        return dataset_id
+
+    def _drop_memoized(self, dataset_id):
+        """Drops the memoized columns and derived structures of a dataset, the lock has to be held"""
+        if dataset_id in self._datasets:
+            self._generation += 1
+            self._generations[dataset_id] = self._generation
+        else:
+            self._generations.pop(dataset_id, None)
+        self._columns = {key: value for key, value in self._columns.items() if key[0] != dataset_id}
+        self._derived = {key: value for key, value in self._derived.items() if key[0] != dataset_id}
+
+    def get(self, dataset_id):
+        """
+        Returns the dataset registered under `dataset_id` and marks it as recently used.
+
+        :raises KeyError: if there is no such dataset, e.g. it has been evicted
+        """
+        with self._lock:
+            try:
+                dataset = self._datasets[dataset_id]
+            except KeyError:
+                self.misses += 1
+                raise
+            self._datasets.move_to_end(dataset_id)
+            self.hits += 1
+
+        return dataset
+
+    def get_column(self, dataset, column):
+        """
+        Column of the feature table of a registered dataset as a read-only NumPy array, converted only on the first
+        request.
+
+        :raises KeyError: if there is no such column
+        """
+        key = (dataset['dataset_id'], column)
+        with self._lock:
+            if key in self._columns:
+                self.column_hits += 1
+                return self._columns[key]
+            generation = self._generations.get(dataset['dataset_id'])
+
+        array = dataset['df'][column].to_numpy()
+        array.flags.writeable = False
+
+        with self._lock:
+            self.column_misses += 1
+            # the dataset might have been evicted, replaced or invalidated meanwhile, keep the cache consistent with
+            # the registry
+            if generation is not None and self._generations.get(dataset['dataset_id']) == generation:
+                self._columns[key] = array
+
+        return array
+
+    def get_derived(self, dataset, name, build):
+        """
+        Structure derived from a registered dataset, e.g. a spatial index, constructed by calling `build()` only on
+        the first request.
+
+        :param name: hashable, identifies the structure and the columns it was built from
+        """
+        key = (dataset['dataset_id'], name)
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+            generation = self._generations.get(dataset['dataset_id'])
+
+        value = build()
+
+        with self._lock:
+            if generation is not None and self._generations.get(dataset['dataset_id']) == generation:
+                self._derived[key] = value
+
+        return value
+
+    def invalidate(self, dataset_id):
+        """Drops the memoized columns and derived structures of a dataset, e.g. after rows were appended to it"""
+        with self._lock:
+            self._drop_memoized(dataset_id)
+
+    def get_stats(self):
+        """Counters of the registry and of the column cache, for monitoring"""
+        with self._lock:
+            return dict(size=len(self._datasets), max_size=self.max_size, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, columns=len(self._columns), column_hits=self.column_hits,
+                        column_misses=self.column_misses, derived=len(self._derived))
+
+    def __contains__(self, dataset_id):
+        with self._lock:
+            return dataset_id in self._datasets
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datasets)
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
+            self._columns.clear()
+            self._derived.clear()
+            self._generations.clear()
+
+
+def get_dataset_id(cache_key):
+    """Id of a dataset from the dictionary identifying its source, see `cache.get_cache_key()`"""
+    return hashlib.sha1(json.dumps(cache_key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+# the registry shared by the callbacks of the application
+registry = DatasetRegistry()
@@ -0,0 +1,134 @@
+"""
+Subsampling of the points of large datasets, so the graph shows a representative subset of them. The samples are
+rows of the full feature table, so every sampled point maps back to its full-resolution row.
+
+Methods:
+    'uniform': rows drawn uniformly at random
+    'species': stratified by species, every species gets a share of the sample proportional to its number of points,
+               but at least one point, so rare species are not lost
+    'fps': farthest-point sampling in the projection, approximated on grids, covering sparse regions and outliers as
+           well as dense ones
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from projection_viewer import spatial
+
+SAMPLING_METHODS = ('uniform', 'species', 'fps')
+DEFAULT_SAMPLE_POINTS = 50000
+
+# number of levels of the grids of farthest-point sampling, the finest one has 2 ** FPS_LEVELS cells along each axis
+FPS_LEVELS = 16
+
+
+def uniform(n_rows, n_points, seed=0):
+    """`n_points` of the rows `0..n_rows - 1` at random, sorted"""
+    if n_points >= n_rows:
+        return np.arange(n_rows)
+    return np.sort(np.random.default_rng(seed).choice(n_rows, n_points, replace=False))
+
+
+def stratified(labels, n_points, seed=0):
+    """
+    Rows sampled at random within each label, e.g. the species of the atoms, sorted.
+
+    :param labels: (N,) label of each row
+    :param n_points: total number of rows sampled, approximately
+    """
+    n_rows = len(labels)
+    if n_points >= n_rows:
+        return np.arange(n_rows)
+
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    share = np.minimum(np.maximum(n_points * counts // n_rows, 1), counts)
+
+    # random order of the rows, grouped by label, and the rank of each row inside its group
+    order = np.random.default_rng(seed).permutation(n_rows)
+    order = order[np.argsort(inverse[order], kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(n_rows) - starts[inverse[order]]
+
+    return np.sort(order[rank < share[inverse[order]]])
+
+
+def farthest_point(x, y, n_points, seed=0):
+    """
+    Approximate farthest-point sampling of the points of a projection, on a hierarchy of grids: the extent of the
+    points is split into 1, 2x2, 4x4 ... cells and each level adds one point of every occupied cell without one, so
+    sparse regions and outliers are covered before the dense ones. Of the finest level needed, which has more new
+    cells than points left, the ones farthest from the points already chosen are taken. The axes are scaled by the
+    extent of the points, like on the graph.
+
+    The rows are sorted once along a Z-order curve of the cells, in which the cells of every level are contiguous, so
+    each level is a linear pass: about a second for a million points, nearly independent of `n_points`.
+
+    :return: rows of the sampled points, sorted
+    """
+    n_rows = len(x)
+    if n_points >= n_rows:
+        return np.arange(n_rows)
+
+    x_range, y_range = spatial.get_extent(x), spatial.get_extent(y)
+    n_cells = 2 ** FPS_LEVELS
+    ix = np.clip(np.nan_to_num((np.asarray(x, dtype=float) - x_range[0]) / (x_range[1] - x_range[0]) * n_cells),
+                 0, n_cells - 1).astype(np.uint64)
+    iy = np.clip(np.nan_to_num((np.asarray(y, dtype=float) - y_range[0]) / (y_range[1] - y_range[0]) * n_cells),
+                 0, n_cells - 1).astype(np.uint64)
+
+    # rows along the Z-order curve, in random order inside the cells of the finest level
+    order = np.random.default_rng(seed).permutation(n_rows)
+    code = (_spread_bits(ix) | (_spread_bits(iy) << np.uint64(1)))[order]
+    sort = np.argsort(code, kind='stable')
+    order, code = order[sort], code[sort]
+
+    # the first row of a cell is the first row of one of its sub-cells as well, so the rows chosen on a level are
+    # among the first rows of the cells of the next one
+    chosen = np.zeros(n_rows, dtype=bool)
+    n_chosen = 0
+    for level in range(FPS_LEVELS + 1):
+        cells = code >> np.uint64(2 * (FPS_LEVELS - level))
+        first = np.flatnonzero(np.concatenate([[True], cells[1:] != cells[:-1]]))
+        new = first[~chosen[first]]
+        if n_chosen + len(new) > n_points:
+            # the new cells farthest from the chosen points
+            tree = cKDTree(np.column_stack([ix[order[chosen]], iy[order[chosen]]]))
+            distance, _ = tree.query(np.column_stack([ix[order[new]], iy[order[new]]]))
+            new = new[np.argsort(-distance, kind='stable')[:n_points - n_chosen]]
+        chosen[new] = True
+        n_chosen += len(new)
+        if n_chosen == n_points:
+            break
+
+    if n_chosen < n_points:
+        # fewer distinct positions than requested: all of them, the rest at random
+        rest = np.flatnonzero(~chosen)
+        chosen[rest[uniform(len(rest), n_points - n_chosen, seed)]] = True
+
+    return np.sort(order[chosen])
+
+
+def _spread_bits(values):
+    """Spreads the lower 16 bits of unsigned integers to the even bits, for the codes of the Z-order curve"""
+    values = values & np.uint64(0xFFFF)
+    for shift, mask in [(8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)]:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def get_species_labels(structures, system_index, atom_index_in_systems=None):
+    """
+    Species of the points: the atomic number of the atom in atomic mode, and the composition of the geometry in
+    molecular mode (`atom_index_in_systems` is None), as an integer label.
+    """
+    if atom_index_in_systems is not None:
+        return structures.numbers[structures.offsets[system_index] + atom_index_in_systems]
+
+    # number of atoms of each element in each geometry, identical compositions get the same label
+    frames = np.repeat(np.arange(len(structures)), np.diff(structures.offsets))
+    compositions = np.zeros((len(structures), np.max(structures.numbers, initial=0) + 1), dtype=np.int64)
+    np.add.at(compositions, (frames, structures.numbers), 1)
+    _, labels = np.unique(compositions, axis=0, return_inverse=True)
+
+    return labels.reshape(-1)[system_index]
+
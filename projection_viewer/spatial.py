@@ -0,0 +1,232 @@
+"""
+Spatial helpers of the 2D projection: viewports of the graph, server-side rasterization of the points and spatial
+indices for finding the points of a viewport, of a selection or the one nearest to a click.
+"""
+
+import numpy as np
+from matplotlib.path import Path
+from scipy.spatial import cKDTree
+
+
+def parse_viewport(relayout_data):
+    """
+    Reads the axis ranges of the graph from its `relayoutData`.
+
+    Note: relayoutData only holds the changed ranges of the last event, an axis missing from it is treated as showing
+    everything. Zooming and panning in the graph report both axes.
+
+    :return: (x_range, y_range), each [min, max] or None for an autoranged axis
+    """
+    if not relayout_data:
+        return None, None
+
+    ranges = []
+    for axis in ['xaxis', 'yaxis']:
+        try:
+            axis_range = [relayout_data['{}.range[0]'.format(axis)], relayout_data['{}.range[1]'.format(axis)]]
+        except KeyError:
+            axis_range = relayout_data.get('{}.range'.format(axis))
+
+        if axis_range is not None:
+            axis_range = sorted(float(r) for r in axis_range)
+        ranges.append(axis_range)
+
+    return ranges[0], ranges[1]
+
+
+def is_viewport_change(relayout_data):
+    """
+    Whether a `relayoutData` event changed the axis ranges (zoom, pan or autorange), and not e.g. only the drag mode,
+    the selections or the size of the graph.
+    """
+    return any(key.startswith(('xaxis.range', 'yaxis.range', 'xaxis.autorange', 'yaxis.autorange'))
+               for key in relayout_data or dict())
+
+
+def points_in_viewport(x, y, viewport):
+    """Indices of the points inside the viewport, `viewport` is (x_range, y_range) as from `parse_viewport()`"""
+    mask = np.ones(len(x), dtype=bool)
+    for values, axis_range in zip([x, y], viewport):
+        if axis_range is not None:
+            mask &= (values >= axis_range[0]) & (values <= axis_range[1])
+
+    return np.flatnonzero(mask)
+
+
+def get_extent(values, axis_range=None):
+    """
+    The axis range, or the range of the finite values if None, widened if degenerate; a unit range without finite
+    values, e.g. a column of NaN
+    """
+    if axis_range is None:
+        values = np.asarray(values, dtype=float)
+        finite = values[np.isfinite(values)]
+        axis_range = [np.min(finite), np.max(finite)] if len(finite) else [0., 1.]
+    low, high = float(axis_range[0]), float(axis_range[1])
+    if not (np.isfinite(low) and np.isfinite(high)):
+        low, high = 0., 1.
+    elif high <= low:
+        low, high = low - 0.5, high + 0.5
+    return low, high
+
+
+def rasterize(x, y, x_range, y_range, shape):
+    """
+    Counts the points on a regular grid of bins over the given ranges, points outside of the ranges and the ones of
+    non-finite coordinates are dropped.
+
+    :param x: (N,) float
+    :param y: (N,) float
+    :param x_range: [min, max] of the grid along x
+    :param y_range: [min, max] of the grid along y
+    :param shape: (ny, nx) number of bins
+    :return: counts (ny, nx) int, x_centres (nx,), y_centres (ny,)
+    """
+    ny, nx = shape
+    finite = np.isfinite(x) & np.isfinite(y)
+    counts, x_edges, y_edges = np.histogram2d(np.asarray(y)[finite], np.asarray(x)[finite], bins=(ny, nx),
+                                              range=(y_range, x_range))
+
+    return counts.astype(np.int64), 0.5 * (x_edges[1:] + x_edges[:-1]), 0.5 * (y_edges[1:] + y_edges[:-1])
+
+
+class GridIndex:
+    """
+    Points of a projection bucketed into a regular grid of `n_cells` x `n_cells` cells over their extent, with the
+    points of each cell stored contiguously, so the points of a viewport are found by only looking at the cells it
+    overlaps.
+
+    Each point also gets a random priority, so capping the points of a viewport keeps the same points on every zoom and
+    pan instead of a different random subset.
+    """
+
+    def __init__(self, x, y, n_cells=64, seed=0):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.n_cells = n_cells
+        self.x_range = get_extent(self.x)
+        self.y_range = get_extent(self.y)
+
+        cell = self._cell_of(self.x, self.y)
+        self.order = np.argsort(cell, kind='stable')
+        self.cell_offsets = np.searchsorted(cell[self.order], np.arange(n_cells * n_cells + 1))
+
+        # per cell summary: number of points and their centroid
+        self.cell_counts = np.diff(self.cell_offsets)
+        occupied = np.maximum(self.cell_counts, 1)
+        self.cell_x = np.bincount(cell, weights=self.x, minlength=n_cells * n_cells) / occupied
+        self.cell_y = np.bincount(cell, weights=self.y, minlength=n_cells * n_cells) / occupied
+
+        self.priority = np.random.default_rng(seed).permutation(len(self.x))
+
+    def _cell_coordinate(self, values, axis_range):
+        """Cell index along one axis, clipped to the grid"""
+        scaled = (np.asarray(values, dtype=float) - axis_range[0]) / (axis_range[1] - axis_range[0]) * self.n_cells
+        return np.clip(np.nan_to_num(scaled), 0, self.n_cells - 1).astype(np.int64)
+
+    def _cell_of(self, x, y):
+        return self._cell_coordinate(y, self.y_range) * self.n_cells + self._cell_coordinate(x, self.x_range)
+
+    def _cell_span(self, axis_range, extent):
+        """First and last cell overlapping the range along one axis"""
+        if axis_range is None:
+            return 0, self.n_cells - 1
+        low, high = self._cell_coordinate(axis_range, extent)
+        return int(low), int(high)
+
+    def query(self, viewport):
+        """Rows of the points inside the viewport, exactly, see `points_in_viewport()`"""
+        if viewport[0] is None and viewport[1] is None:
+            return np.arange(len(self.x))
+
+        x0, x1 = self._cell_span(viewport[0], self.x_range)
+        y0, y1 = self._cell_span(viewport[1], self.y_range)
+        # the cells of a row of the grid are contiguous
+        starts = self.cell_offsets[np.arange(y0, y1 + 1) * self.n_cells + x0]
+        stops = self.cell_offsets[np.arange(y0, y1 + 1) * self.n_cells + x1 + 1]
+        if np.sum(stops - starts) > len(self.x) // 8:
+            # most of the points are in the viewport, checking all of them is faster than collecting them by cells
+            return points_in_viewport(self.x, self.y, viewport)
+
+        candidates = np.concatenate([self.order[start:stop] for start, stop in zip(starts, stops)])
+
+        return np.sort(candidates[points_in_viewport(self.x[candidates], self.y[candidates], viewport)])
+
+    def cap(self, rows, max_points):
+        """At most `max_points` of the rows, the ones of the highest priority"""
+        if len(rows) <= max_points:
+            return rows
+        return np.sort(rows[np.argpartition(self.priority[rows], max_points)[:max_points]])
+
+    def summary_outside(self, viewport):
+        """
+        Centroids and number of points of the non-empty cells not overlapping the viewport, a coarse picture of the
+        points outside of it.
+
+        :return: x (M,), y (M,), counts (M,)
+        """
+        outside = self.cell_counts > 0
+        x0, x1 = self._cell_span(viewport[0], self.x_range)
+        y0, y1 = self._cell_span(viewport[1], self.y_range)
+        outside.reshape(self.n_cells, self.n_cells)[y0:y1 + 1, x0:x1 + 1] = False
+
+        return self.cell_x[outside], self.cell_y[outside], self.cell_counts[outside]
+
+
+class PointIndex:
+    """
+    KD-tree of the points of a projection, for finding the point nearest to a clicked coordinate and the points of a
+    box or lasso selection.
+
+    The axes are scaled by the extent of the points, so distances are measured like on the graph rather than in the
+    units of the two columns.
+    """
+
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.x_range = get_extent(self.x)
+        self.y_range = get_extent(self.y)
+        self.tree = cKDTree(np.column_stack(self._scale(self.x, self.y)))
+
+    def _scale(self, x, y):
+        return (np.asarray(x, dtype=float) - self.x_range[0]) / (self.x_range[1] - self.x_range[0]), \
+               (np.asarray(y, dtype=float) - self.y_range[0]) / (self.y_range[1] - self.y_range[0])
+
+    def nearest(self, x, y):
+        """Row of the point nearest to (x, y)"""
+        _, row = self.tree.query(np.column_stack(self._scale([x], [y]))[0])
+        return int(row)
+
+    def in_box(self, x_range, y_range):
+        """Rows of the points in the box, sorted"""
+        (x0, x1), (y0, y1) = self._scale(sorted(x_range), sorted(y_range))
+        # the smallest square around the box in the max-norm, then the exact box
+        centre = [0.5 * (x0 + x1), 0.5 * (y0 + y1)]
+        candidates = np.asarray(self.tree.query_ball_point(centre, r=0.5 * max(x1 - x0, y1 - y0), p=np.inf),
+                                dtype=np.int64)
+
+        return np.sort(candidates[points_in_viewport(self.x[candidates], self.y[candidates],
+                                                     (sorted(x_range), sorted(y_range)))])
+
+    def in_lasso(self, lasso_x, lasso_y):
+        """Rows of the points inside the polygon of the lasso, sorted"""
+        candidates = self.in_box([np.min(lasso_x), np.max(lasso_x)], [np.min(lasso_y), np.max(lasso_y)])
+        path = Path(np.column_stack([lasso_x, lasso_y]))
+
+        return candidates[path.contains_points(np.column_stack([self.x[candidates], self.y[candidates]]))]
+
+    def select(self, selected_data):
+        """
+        Rows of the points of a box or lasso selection of the graph, from its `selectedData`. The selection is resolved
+        on the server, so it includes the points that were not sent to the browser, e.g. aggregated or culled ones.
+
+        :return: rows, or None if there is no box or lasso in the selection
+        """
+        if not selected_data:
+            return None
+        if 'range' in selected_data:
+            return self.in_box(selected_data['range']['x'], selected_data['range']['y'])
+        if 'lassoPoints' in selected_data:
+            return self.in_lasso(selected_data['lassoPoints']['x'], selected_data['lassoPoints']['y'])
+        return None
@@ -0,0 +1,66 @@
+"""
+Compact storage of the geometries of a dataset, for the 3D viewer.
+"""
+
+import ase
+import numpy as np
+
+
+class StructureStore:
+    """
+    Geometries kept as contiguous arrays, with the atoms of geometry `i` at `offsets[i]:offsets[i + 1]`.
+
+    Only the geometries requested by the viewer are turned into ase.Atoms, on demand.
+    """
+
+    def __init__(self, numbers, positions, cells, pbc, offsets):
+        """
+        :param numbers: (n_atoms,) int, atomic numbers of all atoms
+        :param positions: (n_atoms, 3) float, positions of all atoms
+        :param cells: (n_frames, 3, 3) float, cell vectors of the geometries
+        :param pbc: (n_frames, 3) bool, periodic boundary conditions of the geometries
+        :param offsets: (n_frames + 1,) int, index of the first atom of the geometries and the total number of atoms
+        """
+        self.numbers = np.asarray(numbers, dtype=np.int64)
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.cells = np.asarray(cells, dtype=np.float64).reshape(-1, 3, 3)
+        self.pbc = np.asarray(pbc, dtype=bool).reshape(-1, 3)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_atoms(cls, atoms_list):
+        """Constructs the store from a list of ase.Atoms"""
+        offsets = np.zeros(len(atoms_list) + 1, dtype=np.int64)
+        np.cumsum([len(at) for at in atoms_list], out=offsets[1:])
+
+        return cls(numbers=np.concatenate([at.numbers for at in atoms_list]),
+                   positions=np.concatenate([at.positions for at in atoms_list]),
+                   cells=np.array([at.cell.array for at in atoms_list]),
+                   pbc=np.array([at.pbc for at in atoms_list]),
+                   offsets=offsets)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """Concatenates stores of consecutive chunks of geometries into one store"""
+        atom_offsets = np.cumsum([0] + [store.offsets[-1] for store in stores[:-1]])
+
+        return cls(numbers=np.concatenate([store.numbers for store in stores]),
+                   positions=np.concatenate([store.positions for store in stores]),
+                   cells=np.concatenate([store.cells for store in stores]),
+                   pbc=np.concatenate([store.pbc for store in stores]),
+                   offsets=np.concatenate([[0]] + [store.offsets[1:] + shift
+                                                   for store, shift in zip(stores, atom_offsets)]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_atoms(self, index):
+        """Constructs the ase.Atoms of geometry `index`"""
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return ase.Atoms(numbers=self.numbers[start:stop], positions=self.positions[start:stop],
+                         cell=self.cells[index], pbc=self.pbc[index])
+
+    def to_arrays(self):
+        """Dictionary of the arrays of the store, the inverse of `StructureStore(**arrays)`"""
+        return dict(numbers=self.numbers, positions=self.positions, cells=self.cells, pbc=self.pbc,
+                    offsets=self.offsets)
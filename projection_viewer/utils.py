@@ -1,12 +1,47 @@
+import base64
+import fnmatch
+import glob
 import json
 import os
+import re
+import threading
+import time
 from argparse import ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 
 import ase
 import ase.io
 import numpy as np
 import pandas as pd
+from plotly.utils import PlotlyJSONEncoder
+
+from projection_viewer import cache as dataset_cache
+from projection_viewer import profiling
+from projection_viewer import sampling as point_sampling
+from projection_viewer import spatial
+from projection_viewer import xyz_reader
+from projection_viewer.registry import get_dataset_id, registry as dataset_registry
+from projection_viewer.structures import StructureStore
+
+# files smaller than this are read serially, the process pool is not worth it for them
+PARALLEL_MIN_FILE_SIZE = 64 * 1024 ** 2
+
+# typed array dtypes of the float arrays of the figures, see `encode_figure_array()`
+FIGURE_PRECISIONS = {'float32': 'f4', 'float64': 'f8'}
+DEFAULT_FIGURE_PRECISION = 'float32'
+
+# percentiles of the quantile tables of the columns, see `get_column_statistics()`
+QUANTILE_GRID = np.linspace(0., 100., 101)
+
+# float columns are converted to float32 if no value changes by more than this fraction of the range of the column
+FLOAT32_TOLERANCE = 1e-6
+
+# serialises appending the new frames of followed files, see `read_new_frames()`
+_follow_lock = threading.Lock()
+
+# seconds between the checks of a followed file for its first complete frame, see `wait_for_first_frame()`
+FOLLOW_WAIT_INTERVAL = 1.0
 
 
 def get_features_molecular(feature, atoms):
@@ -43,7 +78,7 @@ def ase2json(atoms_ase):
     for i, pos in enumerate(atoms_ase.get_positions()):
         elem = str(atoms_ase.get_chemical_symbols()[i])
         json_str += '{"name":"' + elem + '","chain":"A","residue_index":0,"residue_name":"A", "serial": "' + str(
-            i) + '","element":"' + elem + '", "positions":' + str(list(pos)) + '}'
+            i) + '","element":"' + elem + '", "positions":' + str(pos.tolist()) + '}'
         if not i == len(atoms_ase) - 1:
             json_str += ","
     json_str += '], "bonds": [], "pbc": {}, "cell": {}}}'.format(str(atoms_ase.get_pbc().tolist()).lower(),
@@ -104,37 +139,78 @@ def get_hex_color(c_rgb):
 #     return a_str
 
 
-def build_dataframe_features(atoms, mode='molecular'):
-    if mode == 'atomic':
-        keys = atoms[0].arrays.keys()
-    else:
-        keys = atoms[0].info.keys()
+def _concatenate_arrays(atoms, key):
+    """Concatenates ``Atoms.arrays[key]`` of all geometries in `atoms` into a single array"""
+    return np.concatenate([atoms_i.arrays[key] for atoms_i in atoms])
+
+
+def split_keys(atoms, mode='molecular', column_filter=None):
+    """
+    Splits the keys of `Atoms.arrays` (atomic mode) or `Atoms.info` (molecular mode) of the first geometry into the
+    ones loaded into the feature table and the skipped ones, by `column_filter`, a dict of (all optional):
+        'include': list of fnmatch patterns, only the keys matching any of them are loaded
+        'exclude': list of fnmatch patterns, the keys matching any of them are skipped
+        'max_vector_width': int, vector valued keys with more components are skipped, e.g. SOAP vectors
+
+    :return: list of loaded keys, list of skipped keys
+    """
+    values = atoms[0].arrays if mode == 'atomic' else atoms[0].info
+    column_filter = column_filter or dict()
+    include = column_filter.get('include')
+    exclude = column_filter.get('exclude') or []
+    max_vector_width = column_filter.get('max_vector_width')
+
+    keys, skipped = [], []
+    for k, value in values.items():
+        if mode == 'atomic':
+            width = int(np.prod(np.shape(value)[1:]))
+        else:
+            width = np.size(value) if isinstance(value, np.ndarray) else 1
+
+        if (include is not None and not any(fnmatch.fnmatchcase(k, p) for p in include)) or \
+                any(fnmatch.fnmatchcase(k, p) for p in exclude) or \
+                (max_vector_width is not None and width > max_vector_width):
+            skipped.append(k)
+        else:
+            keys.append(k)
+
+    return keys, skipped
+
+
+def build_dataframe_features(atoms, mode='molecular', column_filter=None):
+    """
+    Builds the feature table of the geometries in `atoms`.
+
+    In atomic mode the table is built column-wise: every entry of `Atoms.arrays` is concatenated once over all
+    geometries and vector valued arrays are split into `key_i` columns by slicing.
+
+    :param atoms: list of ase.Atoms
+    :param mode: `atomic` OR `molecular`
+    :param column_filter: dict, the keys skipped by it are never read, see `split_keys()`
+    :return: pd.DataFrame, with one row per atomic environment or per geometry
+    """
+    keys, _ = split_keys(atoms, mode, column_filter)
 
     keys_expanded = {}
 
     if mode == 'atomic':
-        at_numbers = np.array([i for mol in atoms for i, y in enumerate(list(mol.get_chemical_symbols()))])
-        sys_ids = []
-        for i, mol in enumerate(atoms):
-            sys_ids += [i] * len(mol)
-        keys_expanded['system_ids'] = sys_ids
-        keys_expanded['atomic_numbers'] = at_numbers
+        n_atoms = np.array([len(mol) for mol in atoms])
+        keys_expanded['system_ids'] = np.repeat(np.arange(len(atoms)), n_atoms)
+        # NB: this is the index of the atom inside its geometry, used as `atom_index_in_systems` by `load_xyz()`
+        keys_expanded['atomic_numbers'] = np.concatenate([np.arange(n) for n in n_atoms])
     elif mode == 'molecular':
         keys_expanded['system_ids'] = list(range(len(atoms)))
 
     for k in keys:
         try:
             if mode == 'atomic':
-                if len(atoms[0].arrays[k].shape) > 1:
-                    for i in range(atoms[0].arrays[k].shape[1]):
-                        print(k, i)
-                        keys_expanded[k + '_' + str(i)] = np.array(
-                            [x.arrays[k][j][i] for x in atoms for j in range(len(x))]).flatten()
-                        print(np.array(keys_expanded[k + '_' + str(i)]).shape)
+                values = _concatenate_arrays(atoms, k)
+                if values.ndim > 1:
+                    values = values.reshape(len(values), -1)
+                    for i in range(values.shape[1]):
+                        keys_expanded[k + '_' + str(i)] = values[:, i]
                 else:
-                    keys_expanded[k] = np.array([x.arrays[k][j] for x in atoms for j in range(len(x))]).flatten()
-                    print(k, len(keys_expanded[k]))
-                    continue
+                    keys_expanded[k] = values
 
             else:
                 if isinstance(atoms[0].info[k], np.ndarray):
@@ -158,9 +234,159 @@ def build_dataframe_features(atoms, mode='molecular'):
 
 
 def get_new_sizes(value, value_range, size_range):
-    """Map ``value`` to a range within ``size_range`` in a linear fashion."""
-    slope = (size_range[1] - size_range[0]) / float(value_range[1] - value_range[0])
-    return size_range[0] + slope * (value - value_range[0])
+    """
+    Map ``value`` to a range within ``size_range`` in a linear fashion, flat below and above ``value_range``.
+
+    Vectorized, ``value`` can be a scalar or an array. A degenerate ``value_range`` (lower == upper) gives a step
+    function: values below, above and equal to it are mapped to the lower, upper and middle size respectively.
+    NaN values are mapped to the lower size.
+    """
+    value = np.asarray(value, dtype=float)
+    lower, upper = value_range
+
+    if upper > lower:
+        # in-place operations on a single array, values below the range become exactly the lower size
+        slope = (size_range[1] - size_range[0]) / float(upper - lower)
+        sizes = np.clip(value, lower, upper, out=np.empty_like(value))
+        sizes -= lower
+        sizes *= slope
+        sizes += size_range[0]
+    else:
+        sizes = np.full(value.shape, 0.5 * (size_range[0] + size_range[1]))
+        sizes[value < lower] = size_range[0]
+
+    sizes[value > upper] = size_range[1]
+    sizes[np.isnan(value)] = size_range[0]
+    return sizes
+
+
+def get_column_statistics(dataframe):
+    """
+    Statistics of the columns of the feature table, computed once when the dataset is built and stored with it.
+
+    :return: dict of
+        'column_stats': pd.DataFrame, one row per column with its name, min, max, mean and std
+        'column_quantiles': (n_columns, len(QUANTILE_GRID)) float, the percentiles `QUANTILE_GRID` of each column
+        Non-finite values are ignored, non-numeric columns get NaN.
+    """
+    n_columns = len(dataframe.columns)
+    stats = np.full((n_columns, 4), np.nan)
+    quantiles = np.full((n_columns, len(QUANTILE_GRID)), np.nan)
+
+    for i, (column, series) in enumerate(dataframe.items()):
+        if not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)):
+            continue
+        values = series.to_numpy(dtype=float)
+        values = np.sort(values[np.isfinite(values)])
+        if len(values) == 0:
+            continue
+        stats[i] = values[0], values[-1], np.mean(values), np.std(values)
+
+        # linear interpolation between the closest ranks, as np.percentile(), but with a single sort
+        rank = QUANTILE_GRID / 100. * (len(values) - 1)
+        below = np.floor(rank).astype(np.int64)
+        above = np.minimum(below + 1, len(values) - 1)
+        quantiles[i] = values[below] + (values[above] - values[below]) * (rank - below)
+
+    column_stats = pd.DataFrame({'column': [str(c) for c in dataframe.columns], 'min': stats[:, 0],
+                                 'max': stats[:, 1], 'mean': stats[:, 2], 'std': stats[:, 3]})
+
+    return dict(column_stats=column_stats, column_quantiles=quantiles)
+
+
+def get_column_summary(dataset, column):
+    """
+    Statistics of a column of the dataset by its name or index, see `get_column_statistics()`.
+
+    Datasets constructed without the statistics get them computed on the first request, memoized in the registry.
+
+    :return: dict of min, max, mean, std and the quantile table `quantiles`
+    """
+    if 'column_stats' in dataset:
+        statistics = dataset
+    else:
+        statistics = dataset_registry.get_derived(dataset, 'statistics', lambda: get_column_statistics(dataset['df']))
+
+    if not isinstance(column, (int, np.integer)):
+        column = dataset['df'].columns.get_loc(column)
+    summary = statistics['column_stats'].iloc[column]
+
+    return dict(min=summary['min'], max=summary['max'], mean=summary['mean'], std=summary['std'],
+                quantiles=statistics['column_quantiles'][column])
+
+
+def get_column_limits(dataset, column, limits, scale='linear'):
+    """
+    Values of a column at the limits of a slider, looked up in the statistics of the column:
+        'linear': the limits are percentages of the range between the min and the max of the column
+        'quantile': the limits are percentiles of the column, so outliers do not squeeze the rest of the values
+
+    :param limits: [lower, upper] in percent
+    :return: lower, upper
+    """
+    summary = get_column_summary(dataset, column)
+    if scale == 'quantile':
+        lower, upper = np.interp(limits, QUANTILE_GRID, summary['quantiles'])
+        return float(lower), float(upper)
+
+    span = np.abs(summary['max'] - summary['min'])
+    return summary['min'] + span / 100. * limits[0], summary['min'] + span / 100. * limits[1]
+
+
+def encode_typed_array(values, dtype='f4'):
+    """
+    Encodes a numeric array as a plotly.js typed array: the base64 encoded little-endian buffer and its dtype.
+
+    This is ~4x smaller than the JSON list of the decimal numbers for float32 and parsed faster by the browser.
+
+    :param values: (N,) numeric array, or 2D for heatmaps
+    :param dtype: str, typed array dtype understood by plotly.js: f8, f4, i4, u4, i2, u2, i1, u1
+    """
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    encoded = {'dtype': dtype, 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+    if array.ndim > 1:
+        encoded['shape'] = ','.join(str(n) for n in array.shape)
+    return encoded
+
+
+def encode_figure_array(values, precision=DEFAULT_FIGURE_PRECISION):
+    """
+    Encodes an array of the figure according to `precision`:
+        'float32' or 'float64': typed arrays of numeric data, integers as int32
+        'json': JSON lists of numbers, for plotly.js versions before 2.28 not supporting typed arrays
+
+    Non-numeric arrays are always JSON lists.
+    """
+    values = np.asarray(values)
+    if precision == 'json' or not (np.issubdtype(values.dtype, np.number) or values.dtype == bool):
+        return values.tolist()
+
+    if np.issubdtype(values.dtype, np.integer) and values.size and \
+            np.iinfo(np.int32).min <= values.min() and values.max() <= np.iinfo(np.int32).max:
+        return encode_typed_array(values, 'i4')
+
+    return encode_typed_array(values, FIGURE_PRECISIONS[precision])
+
+
+def encode_marker_sizes(sizes, precision=DEFAULT_FIGURE_PRECISION):
+    """
+    Encodes the marker sizes of the figure: rounded to whole pixels as a `u1` typed array (1 byte per point instead
+    of 4), the sizes of the slider are at most 100 pixels. JSON lists with `precision == 'json'`.
+
+    Non-finite sizes, which have no defined cast to `u1`, become the smallest finite one.
+    """
+    if precision == 'json':
+        return encode_figure_array(sizes, precision)
+    sizes = np.asarray(sizes, dtype=float)
+    finite = np.isfinite(sizes)
+    if not finite.all():
+        sizes = np.where(finite, sizes, np.min(sizes[finite]) if finite.any() else 0.)
+    return encode_typed_array(np.clip(np.rint(sizes), 0, 255), 'u1')
+
+
+def get_figure_payload_size(figure):
+    """Size of the figure serialised as JSON, in bytes, as it is sent to the browser"""
+    return len(json.dumps(figure, cls=PlotlyJSONEncoder).encode('utf-8'))
 
 
 def process_marker_opacity_value(marker_opacity_value):
@@ -186,56 +412,735 @@ def process_marker_opacity_value(marker_opacity_value):
     return marker_opacity_value
 
 
-def load_xyz(filename, mode='atomic', verbose=True):
+def load_xyz(filename, mode='atomic', verbose=True, cache=True, cache_dir=None, n_workers=None, column_filter=None,
+             follow=False, report_file=None, return_report=False):
     """
-    Loads the XYZ file and constructs a dictionary to be added to app-data.
+    Loads the XYZ file into the dataset registry and constructs a dictionary to be added to app-data.
 
     with N systems, which is N frames in molecular mode and N individual atomic envs in atomic mode.
 
     Dictionary format:
+        'dataset_id': str, id of the dataset in `registry.registry`
+        'extended_xyz_file': str, the file read, for reloading the dataset if evicted from the registry; list of str
+                             if several files were read
+        'cache_dir': str, directory of the on-disk cache
+        'mode': str, mode saved
+        'column_filter': dict or None, the columns loaded, see `split_keys()`
+        'follow': bool, the file is followed for appended frames, see `read_new_frames()`
+
+    The dataset in the registry is a dictionary of:
+        'df': pd.DataFrame, the features
         'system_index': (N,) int, indices of the frames of tha atoms objects
-        'atom_index_in_systems': (N,) int,  indices of atoms inside the frames; None if mode=atomic
-        'df_json': the dataframe in json format
-        'atoms_list_json': json list, the atoms objects encoded into json format
-        'list_hovertexts': (N,) str, list of texts (~HTML) to show on hovering over the points
+        'atom_index_in_systems': (N,) int,  indices of atoms inside the frames; None if mode=molecular
+        'structures': StructureStore, the geometries
+        'column_stats': pd.DataFrame, min, max, mean and std of the columns, see `get_column_statistics()`
+        'column_quantiles': (n_columns, 101) float, quantile tables of the columns
+        'skipped_keys': list of str, keys of the file not loaded due to `column_filter`, see `load_columns()`
+        'parsed_bytes': int, end of the last frame read of a followed file
+        'source_files': list of str, the files read if several, see `build_dataset_from_files()`
         'mode': str, mode saved
+        'dataset_id': str, id of the dataset in the registry
 
+    The constructed dataset is kept in an on-disk cache (see `projection_viewer.cache`), which is read instead of
+    the XYZ file as long as the file is unchanged.
 
-    :param filename:
+    :param filename: path, glob pattern or list of them; several files are loaded as one dataset, see
+        `build_dataset_from_files()`
     :param mode:
     :param verbose:
-    :return:
+    :param cache: bool, read and write the on-disk cache
+    :param cache_dir: directory of the cache files, None for the default one
+    :param n_workers: number of processes for parsing large files, see `build_dataset()`
+    :param column_filter: dict of include/exclude patterns and the maximum vector width of the keys loaded, see
+        `split_keys()`; None loads all keys
+    :param follow: bool, the file is still being appended to, e.g. by an MD run: only its complete frames are read,
+        the cache is not used and the id of the dataset does not depend on the size of the file; waits for its first
+        complete frame, see `wait_for_first_frame()`
+    :param report_file: path of a JSON lines file the load report is appended to, see `profiling.LoadReport`
+    :param return_report: return the load report as well
+    :return: dict of the app-data; and the load report (dict of the time and memory of each stage of the loading,
+        see `profiling.LoadReport.to_dict()`) if `return_report`
+    """
+    report = profiling.LoadReport()
+
+    filenames = get_filenames(filename)
+    if follow and xyz_reader.is_compressed(filenames[0]):
+        raise ValueError('A compressed file cannot be followed: {}'.format(filenames[0]))
+    if len(filenames) == 1:
+        filename = filenames[0]
+        cache_key = dataset_cache.get_cache_key(filename, mode, column_filter=column_filter)
+    elif follow:
+        raise ValueError('Only a single file can be followed, got {}'.format(filenames))
+    else:
+        filename = filenames
+        cache_key = dict(files=[dataset_cache.get_cache_key(f, mode, column_filter=column_filter)
+                                for f in filenames])
+    if follow:
+        cache = False
+        cache_key = dict(path=cache_key['path'], mode=mode, columns=column_filter, follow=True)
+        wait_for_first_frame(filename)
+    dataset_id = get_dataset_id(cache_key)
+
+    registered = dataset_id in dataset_registry
+    if not registered:
+        if len(filenames) == 1:
+            dataset = read_or_build_dataset(filename, mode=mode, cache=cache, cache_dir=cache_dir,
+                                            n_workers=n_workers, verbose=verbose, column_filter=column_filter,
+                                            complete_only=follow, report=report)
+        else:
+            dataset = build_dataset_from_files(filenames, mode=mode, cache=cache, cache_dir=cache_dir,
+                                               n_workers=n_workers, verbose=verbose, column_filter=column_filter,
+                                               report=report)
+
+        if verbose:
+            print('New Dataframe\n', dataset['df'].head())
+
+        with report.stage('register') as record:
+            dataset['mode'] = mode
+            dataset['dataset_id'] = dataset_id
+            dataset_registry.register(dataset_id, dataset)
+            record.update(profiling.get_table_size(dataset['df']))
+
+    data = {'dataset_id': dataset_id,
+            'extended_xyz_file': filename,
+            'cache_dir': cache_dir,
+            'mode': mode,
+            'column_filter': column_filter,
+            'follow': follow}
+
+    load_report = report.to_dict(file=filename, mode=mode, dataset_id=dataset_id, registered=registered)
+    if verbose:
+        print(profiling.format_load_report(load_report))
+    if report_file is not None:
+        profiling.write_load_report(load_report, report_file)
+
+    if return_report:
+        return data, load_report
+    return data
+
+
+def get_filenames(filename):
+    """
+    List of the input files from a filename, a glob pattern (e.g. `data/*.xyz`) or a list of these; the matches of a
+    pattern are sorted and every file is listed once.
+
+    :raises FileNotFoundError: if a pattern matches no file
+    """
+    filenames = []
+    for pattern in ([filename] if isinstance(filename, str) else filename):
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise FileNotFoundError('No file matches `{}`'.format(pattern))
+        filenames.extend(f for f in matches if f not in filenames)
+
+    return filenames
+
+
+def read_or_build_dataset(filename, mode='atomic', cache=True, cache_dir=None, n_workers=None, verbose=True,
+                          column_filter=None, complete_only=False, report=None):
+    """
+    The dataset of a single file from the on-disk cache, or built and written into the cache if not there.
+
+    :param report: profiling.LoadReport the stages are recorded in, or None
+    """
+    dataset = None
+    if cache:
+        with profiling.stage(report, 'cache_read') as record:
+            dataset = dataset_cache.read_cache(filename, mode, cache_dir=cache_dir, verbose=verbose,
+                                               column_filter=column_filter)
+            if dataset is not None:
+                record.update(profiling.get_table_size(dataset['df']))
+                record['bytes'] = os.path.getsize(dataset_cache.get_cache_path(filename, mode, cache_dir,
+                                                                               column_filter=column_filter))
+
+    if dataset is None:
+        dataset = build_dataset(filename, mode=mode, n_workers=n_workers, verbose=verbose,
+                                column_filter=column_filter, complete_only=complete_only, report=report)
+        if cache:
+            with profiling.stage(report, 'cache_write') as record:
+                record['bytes'] = os.path.getsize(dataset_cache.write_cache(filename, mode, dataset,
+                                                                            cache_dir=cache_dir, verbose=verbose,
+                                                                            column_filter=column_filter))
+
+    return dataset
+
+
+def build_dataset_from_files(filenames, mode='atomic', cache=True, cache_dir=None, n_workers=None, verbose=True,
+                             column_filter=None, report=None):
+    """
+    Constructs the dataset of several files, e.g. the training, validation and test sets, as one.
+
+    The datasets of the files are read from their on-disk caches (the same ones as of loading them one by one), the
+    missing ones are built concurrently, one file per process, and written into the caches. They are concatenated in
+    the order of the files: the geometries are numbered across the files, so `system_index` points into the common
+    structure store, and only the columns present in every file are kept. Two columns are added, `source_file`, the
+    file of the row (categorical), and its index in `filenames`, `source_file_index`, for colouring by the file.
+
+    :param filenames: list of paths
+    :param report: profiling.LoadReport the stages are recorded in, or None
+    :return: dict, see `build_dataset()`, with the list of files `source_files` as well
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    datasets = [None] * len(filenames)
+    if cache:
+        with profiling.stage(report, 'cache_read') as record:
+            datasets = [dataset_cache.read_cache(f, mode, cache_dir=cache_dir, verbose=verbose,
+                                                 column_filter=column_filter) for f in filenames]
+            record['rows'] = sum(len(dataset['df']) for dataset in datasets if dataset is not None)
+    missing = [i for i, dataset in enumerate(datasets) if dataset is None]
+
+    built = []
+    if missing:
+        with profiling.stage(report, 'build_files') as record:
+            if n_workers <= 1 or len(missing) <= 1:
+                built = [build_dataset(filenames[i], mode=mode, n_workers=n_workers, verbose=False,
+                                       column_filter=column_filter) for i in missing]
+            else:
+                with ProcessPoolExecutor(max_workers=min(n_workers, len(missing))) as executor:
+                    built = list(executor.map(_build_file_dataset, [(filenames[i], mode, column_filter)
+                                                                    for i in missing]))
+            record.update(rows=sum(len(dataset['df']) for dataset in built),
+                          bytes=sum(os.path.getsize(filenames[i]) for i in missing))
+
+    if missing and cache:
+        with profiling.stage(report, 'cache_write') as record:
+            record['bytes'] = sum(os.path.getsize(dataset_cache.write_cache(filenames[i], mode, dataset,
+                                                                            cache_dir=cache_dir, verbose=verbose,
+                                                                            column_filter=column_filter))
+                                  for i, dataset in zip(missing, built))
+    for i, dataset in zip(missing, built):
+        datasets[i] = dataset
+
+    # number the geometries across the files
+    frame_offset = 0
+    for dataset in datasets:
+        dataset['system_index'] = np.asarray(dataset['system_index'], dtype=np.int64) + frame_offset
+        if mode == 'molecular':
+            dataset['df']['system_ids'] = dataset['df']['system_ids'].astype(np.int64) + frame_offset
+        frame_offset += len(dataset['structures'])
+
+    n_rows = [len(dataset['df']) for dataset in datasets]
+    with profiling.stage(report, 'concatenate') as record:
+        dataset = concatenate_datasets(datasets, mode=mode)
+        dataset['df']['source_file'] = pd.Categorical.from_codes(np.repeat(np.arange(len(filenames)), n_rows),
+                                                                 categories=filenames)
+        dataset['df']['source_file_index'] = np.repeat(np.arange(len(filenames)), n_rows)
+        dataset['source_files'] = list(filenames)
+        record.update(profiling.get_table_size(dataset['df']))
+
+    # the dtypes of the files might differ, e.g. float32 in one and float64 in the other
+    with profiling.stage(report, 'compaction') as record:
+        dataset['df'], memory_report = compact_dataframe(dataset['df'])
+        dataset['system_index'] = compact_index_array(dataset['system_index'])
+        dataset['atom_index_in_systems'] = compact_index_array(dataset['atom_index_in_systems'])
+        record.update(profiling.get_table_size(dataset['df']))
+    if verbose:
+        print('{} files: {} rows of {} geometries'.format(len(filenames), len(dataset['df']), frame_offset))
+        print(format_memory_report(memory_report))
+
+    with profiling.stage(report, 'statistics') as record:
+        dataset.update(get_column_statistics(dataset['df']))
+        record['columns'] = len(dataset['column_stats'])
+
+    return dataset
+
+
+def _build_file_dataset(args):
+    """Worker of `build_dataset_from_files()`: constructs the dataset of one file, serially"""
+    filename, mode, column_filter = args
+    return build_dataset(filename, mode=mode, n_workers=1, verbose=False, column_filter=column_filter)
+
+
+def wait_for_first_frame(filename, interval=FOLLOW_WAIT_INTERVAL, timeout=None):
+    """
+    Waits until a followed file has a completely written frame, e.g. right after the run writing it started, as
+    there are no columns to show before.
+
+    :param interval: seconds between the checks of the file
+    :param timeout: seconds, None to wait as long as it takes
+    :raises TimeoutError: if there is no complete frame after `timeout` seconds
+    """
+    t0 = time.perf_counter()
+    if len(xyz_reader.index_frames(filename, complete_only=True)) < 2:
+        print('DEBUG: waiting for the first complete frame of {}'.format(filename))
+        while len(xyz_reader.index_frames(filename, complete_only=True)) < 2:
+            if timeout is not None and time.perf_counter() - t0 > timeout:
+                raise TimeoutError('No complete frame in {} after {} s'.format(filename, timeout))
+            time.sleep(interval)
+
+
+def get_dataset(data):
+    """
+    Looks up the dataset of the app-data in the registry, reloading it if it has been evicted.
+
+    :raises KeyError: if no dataset has been loaded into the app-data yet
+    """
+    try:
+        dataset = dataset_registry.get(data['dataset_id'])
+    except KeyError:
+        if 'extended_xyz_file' not in data.keys():
+            raise
+
+        print('DEBUG: dataset {} is not in the registry, reloading it'.format(data['dataset_id']))
+        new_data = load_xyz(data['extended_xyz_file'], data['mode'], verbose=False, cache_dir=data.get('cache_dir'),
+                            column_filter=data.get('column_filter'), follow=data.get('follow', False))
+        dataset = dataset_registry.get(new_data['dataset_id'])
+
+    # the columns loaded on request are not in the cache, after a reload they are appended again in the order of the
+    # app-data, so the column indices of its dropdown menus stay valid
+    missing = [k for k in data.get('loaded_keys') or [] if k not in dataset.get('loaded_keys', [])]
+    if missing:
+        _append_columns(data, dataset, missing)
+    return dataset
+
+
+def load_columns(data, keys):
+    """
+    Loads keys skipped by the column filter of the dataset (see `split_keys()`) into its feature table on request.
+    The file is read again for the requested keys only, their columns are appended to the feature table in the order
+    of the keys in the file, so the indices of the existing columns do not change. The columns loaded on request are
+    not written into the cache.
+
+    :param data: app-data, see `load_xyz()`
+    :param keys: list of str, keys from `dataset['skipped_keys']`
+    :return: app-data with `loaded_keys`, all the keys loaded into the dataset in the order of their columns, for
+        reloading the dataset with the same columns if it is evicted
+    """
+    dataset = get_dataset(data)
+    _append_columns(data, dataset, [k for k in dataset['skipped_keys'] if k in keys])
+    return dict(data, loaded_keys=list(dataset.get('loaded_keys', [])))
+
+
+def _append_columns(data, dataset, keys):
+    """Appends the columns of the skipped `keys`, in their order, to the feature table, see `load_columns()`"""
+    with _follow_lock:
+        # another session might have loaded some of them meanwhile
+        keys = [k for k in keys if k in dataset['skipped_keys']]
+        if not keys:
+            return
+
+        print('DEBUG: loading the columns of {} from {}'.format(keys, data['extended_xyz_file']))
+        column_filter = {'include': [glob.escape(k) for k in keys]}
+        if isinstance(data['extended_xyz_file'], str):
+            columns = build_dataset(data['extended_xyz_file'], mode=data['mode'], verbose=False,
+                                    column_filter=column_filter, complete_only=data.get('follow', False))
+        else:
+            columns = build_dataset_from_files(data['extended_xyz_file'], mode=data['mode'], cache=False,
+                                               verbose=False, column_filter=column_filter)
+
+        # only the new columns, e.g. not `system_ids` in molecular mode, ordered as the keys, and only the rows of the
+        # frames read so far of a followed file
+        new = []
+        for k in keys:
+            new += [i for i, c in enumerate(columns['df'].columns) if i not in new and
+                    c not in dataset['df'].columns and re.fullmatch(re.escape(k) + r'(_\d+)?', c)]
+        columns['df'] = columns['df'].iloc[:len(dataset['df'])]
+
+        # the statistics first, callbacks running meanwhile look up columns by the feature table
+        dataset['column_stats'] = pd.concat([dataset['column_stats'], columns['column_stats'].iloc[new]],
+                                            ignore_index=True)
+        dataset['column_quantiles'] = np.concatenate([dataset['column_quantiles'],
+                                                      columns['column_quantiles'][new]])
+        dataset['df'] = pd.concat([dataset['df'], columns['df'].iloc[:, new].set_index(dataset['df'].index)],
+                                  axis=1)
+        dataset['skipped_keys'] = [k for k in dataset['skipped_keys'] if k not in keys]
+        dataset['loaded_keys'] = dataset.get('loaded_keys', []) + keys
+
+
+def read_new_frames(data):
+    """
+    Appends the frames written to a followed file since it was last read to its dataset (see `load_xyz()`): only the
+    bytes after `dataset['parsed_bytes']` are indexed and parsed, and only its completely written frames.
+
+    The new rows are appended to the feature table, the index arrays and the structure store, the statistics of the
+    columns are merged with the ones of the new rows (see `merge_column_statistics()`) and the memoized columns and
+    spatial indices of the dataset are dropped from the registry.
+
+    Only the parsing is proportional to the new frames: appending copies the whole feature table, index arrays and
+    structure store, and the columns and indices dropped are computed again over all rows on their next use, so a
+    tick costs O(rows of the dataset). Appendable storage, growing the memoized columns and indices in place, would
+    have to replace the `pd.DataFrame` all callbacks read and is not implemented.
+
+    :param data: app-data, see `load_xyz()`
+    :return: int, number of rows appended
+    """
+    dataset = get_dataset(data)
+
+    with _follow_lock:
+        offsets = xyz_reader.index_frames(data['extended_xyz_file'], start_byte=dataset['parsed_bytes'],
+                                          complete_only=True)
+        if len(offsets) < 2:
+            return 0
+
+        # the keys of the table only, the ones skipped or loaded on request as well
+        new = build_dataset_from_atoms(xyz_reader.read_frames(data['extended_xyz_file'], offsets[0], offsets[-1]),
+                                       mode=dataset['mode'], system_offset=len(dataset['structures']),
+                                       column_filter={'exclude': [glob.escape(k) for k in dataset['skipped_keys']]})
+        append_dataset(dataset, new)
+        dataset['parsed_bytes'] = int(offsets[-1])
+
+    dataset_registry.invalidate(dataset['dataset_id'])
+    print('DEBUG: {} rows of {} frames appended to dataset {}'.format(len(new['df']), len(offsets) - 1,
+                                                                      dataset['dataset_id']))
+
+    return len(new['df'])
+
+
+def append_dataset(dataset, new):
+    """
+    Appends the rows of the dataset `new`, constructed by `build_dataset_from_atoms()` from the next frames, to
+    `dataset` in place. The new rows take the columns and dtypes of the feature table, columns missing from them are
+    NaN.
+    """
+    df = new['df'].reindex(columns=dataset['df'].columns)
+    for column, dtype in dataset['df'].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            values = df[column].astype(str)
+            dtype = pd.CategoricalDtype(dtype.categories.union(pd.Index(values.unique()), sort=False))
+            dataset['df'][column] = dataset['df'][column].cat.set_categories(dtype.categories)
+        elif pd.api.types.is_integer_dtype(dtype) and pd.api.types.is_integer_dtype(df[column]):
+            # widen the compacted integer type if the new values do not fit into it
+            dtype = np.promote_types(dtype, pd.to_numeric(df[column], downcast='integer').dtype)
+            if dtype != dataset['df'][column].dtype:
+                dataset['df'][column] = dataset['df'][column].astype(dtype)
+        try:
+            df[column] = df[column].astype(dtype)
+        except (ValueError, TypeError):
+            # e.g. NaN of a missing column in an integer column, the column is upcast by the concatenation
+            pass
+
+    # the statistics first, callbacks running meanwhile look up columns by the feature table
+    statistics = merge_column_statistics(dataset, get_column_statistics(df), len(dataset['df']), len(df))
+    dataset.update(statistics)
+    dataset['system_index'] = compact_index_array(np.concatenate([dataset['system_index'], new['system_index']]))
+    if dataset['atom_index_in_systems'] is not None:
+        dataset['atom_index_in_systems'] = compact_index_array(np.concatenate([dataset['atom_index_in_systems'],
+                                                                               new['atom_index_in_systems']]))
+    dataset['structures'] = StructureStore.concatenate([dataset['structures'], new['structures']])
+    dataset['df'] = pd.concat([dataset['df'], df], ignore_index=True)
+
+
+def merge_column_statistics(statistics, new_statistics, n_rows, n_new_rows):
+    """
+    Statistics of the columns of a table with rows appended, from the statistics of its two parts (see
+    `get_column_statistics()`), without reading the table again. The min, max, mean and std are exact (assuming
+    finite values), the quantile tables are merged as a weighted sample of both quantile functions, which is
+    approximate.
+    Columns without statistics in the new rows keep the old ones.
+    """
+    old, new = statistics['column_stats'], new_statistics['column_stats']
+    weight = n_new_rows / float(n_rows + n_new_rows)
+
+    mean = (1. - weight) * old['mean'] + weight * new['mean']
+    square = (1. - weight) * (old['std'] ** 2 + old['mean'] ** 2) + weight * (new['std'] ** 2 + new['mean'] ** 2)
+    merged = pd.DataFrame({'column': old['column'],
+                           'min': np.fmin(old['min'], new['min']),
+                           'max': np.fmax(old['max'], new['max']),
+                           'mean': mean,
+                           'std': np.sqrt(np.maximum(square - mean ** 2, 0.))})
+    has_new = np.isfinite(new['mean']) & np.isfinite(old['mean'])
+    merged.loc[~has_new, ['min', 'max', 'mean', 'std']] = old.loc[~has_new, ['min', 'max', 'mean', 'std']]
+
+    # the quantile functions of both parts sampled finely, as weighted values, and the percentiles of these
+    fine_grid = np.linspace(0., 100., 10 * (len(QUANTILE_GRID) - 1) + 1)
+    weights = np.concatenate([np.full(len(fine_grid), 1. - weight), np.full(len(fine_grid), weight)])
+    quantiles = statistics['column_quantiles'].copy()
+    for i in np.flatnonzero(has_new):
+        values = np.concatenate([np.interp(fine_grid, QUANTILE_GRID, quantiles[i]),
+                                 np.interp(fine_grid, QUANTILE_GRID, new_statistics['column_quantiles'][i])])
+        order = np.argsort(values, kind='stable')
+        rank = np.cumsum(weights[order]) - 0.5 * weights[order]
+        quantiles[i] = np.interp(QUANTILE_GRID, 100. * rank / rank[-1], values[order])
+        quantiles[i, [0, -1]] = merged.loc[i, 'min'], merged.loc[i, 'max']
+
+    return dict(column_stats=merged, column_quantiles=quantiles)
+
+
+def get_column(dataset, column):
+    """
+    Column of the feature table of the dataset as a NumPy array, by its name or index, memoized in the registry.
+    """
+    if isinstance(column, (int, np.integer)):
+        column = dataset['df'].columns[column]
+    return dataset_registry.get_column(dataset, column)
+
+
+def get_grid_index(dataset, x_column, y_column):
+    """Grid spatial index of the projection onto the two columns, memoized in the registry"""
+    if isinstance(x_column, (int, np.integer)):
+        x_column = dataset['df'].columns[x_column]
+    if isinstance(y_column, (int, np.integer)):
+        y_column = dataset['df'].columns[y_column]
+
+    return dataset_registry.get_derived(dataset, ('grid', x_column, y_column),
+                                        lambda: spatial.GridIndex(get_column(dataset, x_column),
+                                                                  get_column(dataset, y_column)))
+
+
+def get_point_index(dataset, x_column, y_column):
+    """KD-tree of the projection onto the two columns, memoized in the registry"""
+    if isinstance(x_column, (int, np.integer)):
+        x_column = dataset['df'].columns[x_column]
+    if isinstance(y_column, (int, np.integer)):
+        y_column = dataset['df'].columns[y_column]
+
+    return dataset_registry.get_derived(dataset, ('kdtree', x_column, y_column),
+                                        lambda: spatial.PointIndex(get_column(dataset, x_column),
+                                                                   get_column(dataset, y_column)))
+
+
+def get_sample_rows(dataset, sampling, x_column, y_column):
+    """
+    Rows of a sample of the points of the dataset, memoized in the registry, see `projection_viewer.sampling`.
+
+    :param sampling: dict of the sampling 'method' (`uniform`, `species` or `fps`) and the number of points
+        'n_points'
+    :param x_column: the projection, only used by farthest-point sampling
+    :param y_column:
+    :return: (n_points,) int, sorted rows of the full feature table
+    """
+    method = sampling.get('method', 'uniform')
+    n_points = int(sampling.get('n_points', point_sampling.DEFAULT_SAMPLE_POINTS))
+
+    if method == 'uniform':
+        return dataset_registry.get_derived(dataset, ('sample', method, n_points),
+                                            lambda: point_sampling.uniform(len(dataset['df']), n_points))
+    if method == 'species':
+        return dataset_registry.get_derived(dataset, ('sample', method, n_points),
+                                            lambda: point_sampling.stratified(point_sampling.get_species_labels(
+                                                dataset['structures'], dataset['system_index'],
+                                                dataset['atom_index_in_systems']), n_points))
+    if method == 'fps':
+        if isinstance(x_column, (int, np.integer)):
+            x_column = dataset['df'].columns[x_column]
+        if isinstance(y_column, (int, np.integer)):
+            y_column = dataset['df'].columns[y_column]
+        return dataset_registry.get_derived(dataset, ('sample', method, n_points, x_column, y_column),
+                                            lambda: point_sampling.farthest_point(get_column(dataset, x_column),
+                                                                                  get_column(dataset, y_column),
+                                                                                  n_points))
+
+    raise ValueError('Unknown sampling method `{}`, use one of {}'.format(method, point_sampling.SAMPLING_METHODS))
+
+
+def start_sample_rows(data, x_column=0, y_column=0):
+    """
+    Computes the sample of `get_sample_rows()` of the dataset of the app-data for the projection in a background
+    thread, e.g. while the browser loads the page, so the first render does not wait for it.
+
+    :return: the daemon thread started
+    """
+    thread = threading.Thread(target=lambda: get_sample_rows(get_dataset(data), data['sampling'], x_column, y_column),
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+def build_dataset(filename, mode='atomic', n_workers=None, verbose=True, column_filter=None, complete_only=False,
+                  report=None):
+    """
+    Reads the XYZ file and constructs the parts of the dataset that are kept in the on-disk cache.
+
+    Files larger than `PARALLEL_MIN_FILE_SIZE` are split into chunks of frames that are parsed and processed in a
+    pool of `n_workers` processes, smaller ones are read serially. Compressed files (`.gz`, `.xz`, `.bz2`) are
+    streamed in batches of frames, decompressed in a background thread, see `xyz_reader.iter_frame_batches()`.
+
+    :param filename:
+    :param mode:
+    :param n_workers: int, number of processes, None for the number of CPUs and 1 for serial reading
+    :param verbose: print the memory of the feature table before and after compacting its dtypes
+    :param column_filter: dict, the keys loaded, see `split_keys()`
+    :param complete_only: read only the completely written frames of a file that is being appended to, the end of
+        the last one is saved as `parsed_bytes`, see `read_new_frames()`
+    :param report: profiling.LoadReport the stages are recorded in, or None: `parse` and `features` (the feature
+        table and the structure store) when read serially, `parse_features` for both when streamed or parallel, then
+        `compaction` and `statistics`
+    :return: dict with the dataframe `df`, `system_index`, `atom_index_in_systems`, the StructureStore
+        `structures`, the statistics of the columns `column_stats` and `column_quantiles` and the keys not loaded
+        `skipped_keys`, see `load_xyz()` and `get_column_statistics()`
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    offsets = None
+    if xyz_reader.is_compressed(filename):
+        # streamed in batches of frames, only the columns of the processed batches are kept
+        with profiling.stage(report, 'parse_features') as record:
+            datasets, n_frames = [], 0
+            for atoms_list in xyz_reader.iter_frame_batches(filename):
+                batch = build_dataset_from_atoms(atoms_list, mode=mode, system_offset=n_frames,
+                                                 column_filter=column_filter)
+                batch['df'], _ = compact_dataframe(batch['df'])
+                datasets.append(batch)
+                n_frames += len(atoms_list)
+            dataset = concatenate_datasets(datasets, mode=mode)
+            record.update(profiling.get_table_size(dataset['df']))
+    elif n_workers <= 1 or os.path.getsize(filename) < PARALLEL_MIN_FILE_SIZE:
+        with profiling.stage(report, 'parse') as record:
+            if complete_only:
+                offsets = xyz_reader.index_frames(filename, complete_only=True)
+                atoms_list = xyz_reader.read_frames(filename, 0, offsets[-1])
+            else:
+                atoms_list = ase.io.read(filename, ':')
+            record.update(rows=len(atoms_list), bytes=os.path.getsize(filename))
+        with profiling.stage(report, 'features') as record:
+            dataset = build_dataset_from_atoms(atoms_list, mode=mode, column_filter=column_filter)
+            record.update(profiling.get_table_size(dataset['df']))
+    else:
+        # byte ranges of chunks of frames, several chunks per worker for load balancing
+        with profiling.stage(report, 'parse_features') as record:
+            offsets = xyz_reader.index_frames(filename, complete_only=complete_only)
+            chunks = xyz_reader.split_chunks(len(offsets) - 1, 4 * n_workers)
+
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                datasets = list(executor.map(_build_dataset_chunk, [(filename, offsets[start], offsets[stop], mode,
+                                                                      start, column_filter)
+                                                                     for start, stop in chunks]))
+            dataset = concatenate_datasets(datasets, mode=mode)
+            record.update(profiling.get_table_size(dataset['df']))
+
+    # compact dtypes of the feature table and of the indices
+    with profiling.stage(report, 'compaction') as record:
+        dataset['df'], memory_report = compact_dataframe(dataset['df'])
+        dataset['system_index'] = compact_index_array(dataset['system_index'])
+        dataset['atom_index_in_systems'] = compact_index_array(dataset['atom_index_in_systems'])
+        record.update(profiling.get_table_size(dataset['df']))
+    if verbose:
+        print(format_memory_report(memory_report))
+
+    # statistics of the columns over the whole table, for the colour and size limits
+    with profiling.stage(report, 'statistics') as record:
+        dataset.update(get_column_statistics(dataset['df']))
+        record['columns'] = len(dataset['column_stats'])
+
+    if complete_only:
+        dataset['parsed_bytes'] = int(offsets[-1])
+
+    return dataset
+
+
+def _build_dataset_chunk(args):
+    """Worker of `build_dataset()`: parses one chunk of frames and constructs its part of the dataset"""
+    filename, start_byte, stop_byte, mode, system_offset, column_filter = args
+    return build_dataset_from_atoms(xyz_reader.read_frames(filename, start_byte, stop_byte), mode=mode,
+                                    system_offset=system_offset, column_filter=column_filter)
+
+
+def build_dataset_from_atoms(atoms_list, mode='atomic', system_offset=0, column_filter=None):
     """
+    Constructs the dataset from a list of ase.Atoms, see `build_dataset()`.
 
-    # read atoms
-    atoms_list = ase.io.read(filename, ':')
+    :param system_offset: int, index of the first geometry in the whole file, when `atoms_list` is a chunk of it
+    :param column_filter: dict, the keys loaded, see `split_keys()`
+    :raises ValueError: if `atoms_list` is empty, the columns are those of its first geometry
+    """
+    if not atoms_list:
+        raise ValueError('No geometries to construct a dataset of')
     [atoms_list[i].set_pbc(False) for i in range(len(atoms_list))]
 
     # Setup of the dataframes and atom/molecular infos for the 3D-Viewer
-    df = build_dataframe_features(atoms_list, mode=mode)
-    system_index = df['system_ids']
+    df = build_dataframe_features(atoms_list, mode=mode, column_filter=column_filter)
+    df['system_ids'] += system_offset
+    system_index = df['system_ids'].to_numpy()
     atom_index_in_systems = None
     if mode == 'atomic':
-        # system_index = df['system_ids']
-        atom_index_in_systems = df['atomic_numbers']
+        atom_index_in_systems = df['atomic_numbers'].to_numpy()
         df.drop(['atomic_numbers', 'system_ids'], axis=1, inplace=True)
 
-    if verbose:
-        print('New Dataframe\n', df.head())
+    return dict(df=df,
+                system_index=system_index,
+                atom_index_in_systems=atom_index_in_systems,
+                structures=StructureStore.from_atoms(atoms_list),
+                skipped_keys=split_keys(atoms_list, mode, column_filter)[1])
+
 
-    at_list_json = [ase2json(at) for at in atoms_list]
+def concatenate_datasets(datasets, mode='atomic'):
+    """
+    Concatenates datasets of consecutive chunks of frames, the system indices of which are already global.
 
-    # hovertext list for the viewer
-    list_hovertexts = get_hoverinfo_texts(df)
+    Only the columns present in every chunk are kept, in the order of the first one, like keys missing from some
+    frames are skipped by `build_dataframe_features()`.
+    """
+    columns = [c for c in datasets[0]['df'].columns if all(c in d['df'].columns for d in datasets)]
 
-    data = {'system_index': system_index,
-            'atom_index_in_systems': atom_index_in_systems,
-            'df_json': df.to_json(),
-            'atoms_list_json': at_list_json,
-            'list_hovertexts': list_hovertexts,
-            'mode': mode}
+    df = pd.concat([d['df'][columns] for d in datasets], ignore_index=True)
+    system_index = np.concatenate([d['system_index'] for d in datasets])
 
-    return data
+    if mode == 'atomic':
+        atom_index_in_systems = np.concatenate([d['atom_index_in_systems'] for d in datasets])
+    else:
+        atom_index_in_systems = None
+
+    return dict(df=df,
+                system_index=system_index,
+                atom_index_in_systems=atom_index_in_systems,
+                structures=StructureStore.concatenate([d['structures'] for d in datasets]),
+                skipped_keys=datasets[0]['skipped_keys'])
+
+
+def compact_index_array(values):
+    """The smallest signed integer type holding the indices, they are used as array indices only"""
+    if values is None or len(values) == 0:
+        return values
+    values = np.asarray(values)
+    for dtype in [np.int8, np.int16, np.int32]:
+        if np.iinfo(dtype).min <= np.min(values) and np.max(values) <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+def compact_dataframe(dataframe, float_tolerance=FLOAT32_TOLERANCE, max_category_fraction=0.5):
+    """
+    Converts the columns of the feature table to compact dtypes:
+        floats: to float32 if that changes no value by more than `float_tolerance` times the range of the column,
+                so e.g. total energies with a large offset and small differences stay float64
+        integers: to the smallest signed integer type holding their values
+        strings: to categoricals if they have at most `max_category_fraction` distinct values per row
+
+    :return: the compacted dataframe, and a pd.DataFrame reporting the dtype and memory of each column before and
+        after, see `format_memory_report()`
+    """
+    columns = dict()
+    report = []
+    for column, series in dataframe.items():
+        compacted = series
+        if pd.api.types.is_bool_dtype(series):
+            pass
+        elif pd.api.types.is_float_dtype(series):
+            values = series.to_numpy()
+            with np.errstate(over='ignore', invalid='ignore'):
+                values32 = values.astype(np.float32)
+                finite = np.isfinite(values)
+                error = np.abs(values32[finite].astype(np.float64) - values[finite])
+            span = np.ptp(values[finite]) if np.any(finite) else 0.
+            if np.array_equal(np.isfinite(values32), finite) and \
+                    (not len(error) or np.max(error) <= float_tolerance * span):
+                compacted = pd.Series(values32, index=series.index, name=column)
+        elif pd.api.types.is_integer_dtype(series):
+            compacted = pd.to_numeric(series, downcast='integer')
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            pass
+        elif series.nunique(dropna=False) <= max_category_fraction * len(series):
+            compacted = series.astype('category')
+
+        columns[column] = compacted
+        report.append(dict(column=str(column), dtype_before=str(series.dtype), dtype_after=str(compacted.dtype),
+                           bytes_before=int(series.memory_usage(index=False, deep=True)),
+                           bytes_after=int(compacted.memory_usage(index=False, deep=True))))
+
+    return pd.DataFrame(columns, index=dataframe.index), pd.DataFrame(report)
+
+
+def format_memory_report(report):
+    """Text of the report of `compact_dataframe()`: the memory of the feature table before and after, by column"""
+    lines = ['Feature table: {:.2f} MB -> {:.2f} MB'.format(report['bytes_before'].sum() / 1e6,
+                                                           report['bytes_after'].sum() / 1e6)]
+    for row in report.itertuples():
+        lines.append('    {:<30} {:>10} -> {:<10} {:10.2f} MB -> {:.2f} MB'.format(
+            row.column, row.dtype_before, row.dtype_after, row.bytes_before / 1e6, row.bytes_after / 1e6))
+    return '\n'.join(lines)
 
 
 def make_periodic_ase_at(ase_at, periodic_repetition_str='(0,1) (0,1) (0,1)'):
@@ -274,24 +1179,29 @@ def get_asset_folder():
     return os.path.join(_ROOT, '../assets')
 
 
-def get_hoverinfo_texts(dataframe, max_n_cols=20):
+def get_hover_columns(columns, hover_columns=None, max_n_cols=20):
     """
-    By chkunkel, taken from repo at merge time.
+    Chooses the columns shown on hovering over a point.
 
-    Added feature by Tamas Stenczel: limit the number of columns used for performance, this would need to have
-    a parameter or some logic for choosing which ones to include.
+    :param columns: columns of the dataframe
+    :param hover_columns: list of column names, or None for the first `max_n_cols` columns; unknown names are ignored
+    :param max_n_cols: int, limit of the number of columns chosen by default
+    :return: list of column names
     """
-    hover_texts = []
-    if max_n_cols > len(dataframe.columns):
-        # take all of them then
-        max_n_cols = -1
+    if hover_columns is None:
+        return list(columns[:max_n_cols])
 
-    for i, row in dataframe.iterrows():
-        str_hover = ''
-        for c in dataframe.columns[:max_n_cols]:
-            str_hover += '{}: {}<br>'.format(c, row[c])
-        hover_texts.append(str_hover)
-    return hover_texts
+    return [c for c in hover_columns if c in columns]
+
+
+def get_hoverinfo_text(dataframe, row_index, hover_columns):
+    """
+    Markdown text with the values of the hover columns of one point, constructed on demand when it is hovered.
+
+    The values are shown by `str()`, the shortest representation of their own dtype, e.g. of float32 columns.
+    """
+    return '  \n'.join(['**point {}**'.format(row_index)] +
+                        ['{}: {!s}'.format(c, dataframe[c].iat[row_index]) for c in hover_columns])
 
 
 def str2bool(v):
@@ -0,0 +1,161 @@
+"""
+Low level reading of extended xyz files by byte ranges of frames, used for parsing the frames in parallel and for
+reading only the frames appended to a file since it was last read, and streaming of compressed files in batches of
+frames.
+"""
+
+import bz2
+import gzip
+import io
+import itertools
+import lzma
+import queue
+import threading
+
+import ase.io
+import numpy as np
+
+# openers of the compressed files by their extension
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.xz': lzma.open, '.lzma': lzma.open, '.bz2': bz2.open}
+
+
+def index_frames(filename, start_byte=0, complete_only=False):
+    """
+    Finds the byte offsets of the frames in an extended xyz file, in one pass without parsing the frames.
+
+    :param start_byte: offset of the first frame indexed, e.g. the end of the frames read before from a file that is
+        being appended to; only the file after it is read
+    :param complete_only: stop before the first frame that is not completely written yet, i.e. with missing lines
+        or without the newline of its last line
+    :return: (n_frames + 1,) int, offsets of the beginning of the frames and of the end of the last one
+    """
+    offsets = [start_byte]
+    position = start_byte
+
+    with open(filename, 'rb') as f:
+        f.seek(start_byte)
+        for line in f:
+            if line.strip() == b'':
+                # blank line at the end of the file
+                break
+            if complete_only and not line.endswith(b'\n'):
+                break
+            n_atoms = int(line)
+            lines = list(itertools.islice(f, n_atoms + 1))
+            if complete_only and (len(lines) < n_atoms + 1 or not lines[-1].endswith(b'\n')):
+                break
+            position += len(line) + sum(map(len, lines))
+            offsets.append(position)
+
+    return np.array(offsets, dtype=np.int64)
+
+
+def split_chunks(n_frames, n_chunks):
+    """
+    Splits the frames into contiguous chunks of nearly equal number of frames.
+
+    :return: list of (start, stop) frame indices, in order
+    """
+    n_chunks = max(1, min(n_chunks, n_frames))
+    bounds = np.linspace(0, n_frames, n_chunks + 1).round().astype(int)
+    return [(bounds[i], bounds[i + 1]) for i in range(n_chunks) if bounds[i] < bounds[i + 1]]
+
+
+def read_frames(filename, start_byte, stop_byte):
+    """Parses the frames located between the two byte offsets of the file into a list of ase.Atoms"""
+    with open(filename, 'rb') as f:
+        f.seek(start_byte)
+        text = f.read(stop_byte - start_byte).decode('utf-8')
+
+    return ase.io.read(io.StringIO(text), ':', format='extxyz')
+
+
+def is_compressed(filename):
+    """True for the compressed files streamed by `iter_frame_batches()`, by their extension"""
+    return any(filename.endswith(extension) for extension in COMPRESSED_OPENERS)
+
+
+def _put(blocks, item, stop):
+    """Puts the item into the queue, waiting while it is full unless the reading is stopped"""
+    while not stop.is_set():
+        try:
+            blocks.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _decompress(filename, blocks, stop, block_size):
+    """Worker thread of `_iter_blocks()`: puts the decompressed blocks into the queue, then b'' or the exception"""
+    opener = next(o for extension, o in COMPRESSED_OPENERS.items() if filename.endswith(extension))
+    try:
+        with opener(filename, 'rb') as f:
+            block = None
+            while block != b'' and not stop.is_set():
+                block = f.read(block_size)
+                # at most a few blocks are decompressed ahead of the parsing
+                _put(blocks, block, stop)
+    except Exception as e:
+        _put(blocks, e, stop)
+
+
+def _iter_blocks(filename, block_size, n_blocks_ahead):
+    """Decompressed blocks of the file, decompressed in a background thread while the previous ones are parsed"""
+    blocks = queue.Queue(maxsize=n_blocks_ahead)
+    stop = threading.Event()
+    thread = threading.Thread(target=_decompress, args=(filename, blocks, stop, block_size), daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                return
+            yield block
+    finally:
+        # the consumer might stop early, the thread must not wait on the full queue then
+        stop.set()
+        thread.join()
+
+
+def _iter_lines(blocks):
+    """Lines of the blocks, with their newline"""
+    rest = b''
+    for block in blocks:
+        lines = (rest + block).splitlines(keepends=True)
+        rest = lines.pop() if not lines[-1].endswith(b'\n') else b''
+        yield from lines
+    if rest:
+        yield rest
+
+
+def iter_frame_batches(filename, frames_per_batch=1000, block_size=4 * 1024 ** 2, n_blocks_ahead=4):
+    """
+    Parses a compressed extended xyz file in batches of frames, without decompressing it into memory or onto the
+    disk: the file is decompressed in a background thread, overlapping the parsing, and only `n_blocks_ahead` blocks
+    of `block_size` bytes and the text of the current batch are kept in memory.
+
+    :return: generator of lists of ase.Atoms, of `frames_per_batch` frames each except the last one
+    """
+    blocks = _iter_blocks(filename, block_size, n_blocks_ahead)
+    lines = _iter_lines(blocks)
+    batch, n_frames = [], 0
+
+    try:
+        for line in lines:
+            if line.strip() == b'':
+                # blank line at the end of the file
+                break
+            batch.append(line)
+            batch.extend(itertools.islice(lines, int(line) + 1))
+            n_frames += 1
+            if n_frames == frames_per_batch:
+                yield ase.io.read(io.StringIO(b''.join(batch).decode('utf-8')), ':', format='extxyz')
+                batch, n_frames = [], 0
+    finally:
+        blocks.close()
+
+    if batch:
+        yield ase.io.read(io.StringIO(b''.join(batch).decode('utf-8')), ':', format='extxyz')
@@ -18,6 +18,6 @@ setup(name='projection_viewer',
       project_urls={
           'Source Code': 'https://github.com/chkunkel/projection_viewer',
       },
-      install_requires=['ase', 'dash_bio', 'numpy', 'pandas', 'dash', 'plotly'],
+      install_requires=['ase', 'dash_bio', 'numpy', 'pandas', 'dash', 'plotly', 'scipy', 'matplotlib'],
       data_files=[('assets', glob.glob('projection_viewer/assets/*.css')), ]
       )
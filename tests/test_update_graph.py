@@ -0,0 +1,201 @@
+"""
+Tests of `callbacks.update_graph()`: the partial updates of the figure on the marker size and colour inputs.
+"""
+
+import base64
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from dash.exceptions import PreventUpdate
+
+from projection_viewer import callbacks, utils
+from projection_viewer.benchmarks.figure import register_random_dataset
+from projection_viewer.registry import registry
+
+N_POINTS = 100
+
+# x, y, marker size and colour columns, marker size range and limits, colour limits, opacity, colourscale
+GRAPH_ARGS = (0, 1, 2, 3, [5, 50], [0, 100], [0, 100], None, None)
+
+# the ranges of a zoom into a corner of the points
+RELAYOUT_RANGES = {'xaxis.range[0]': 0., 'xaxis.range[1]': 10., 'yaxis.range[0]': 0., 'yaxis.range[1]': 10.}
+
+requires_patch = pytest.mark.skipif(callbacks.Patch is None, reason='partial updates need Dash >= 2.9')
+
+
+@pytest.fixture
+def data():
+    """App-data of a registered dataset of random features"""
+    yield register_random_dataset(N_POINTS)
+    registry.clear()
+
+
+def trigger(monkeypatch, *prop_ids):
+    """Makes `prop_ids` the inputs that triggered the callback"""
+    monkeypatch.setattr(callbacks, 'callback_context',
+                        SimpleNamespace(triggered=[{'prop_id': prop_id, 'value': None} for prop_id in prop_ids]))
+
+
+def get_figure_x(figure):
+    """The x coordinates of the first trace of a figure, sent as a typed array"""
+    return np.frombuffer(base64.b64decode(figure['data'][0]['x']['bdata']), dtype='<f4')
+
+
+def get_figure_sizes(figure):
+    """The marker sizes of the first trace of a figure, sent as a typed array"""
+    return np.frombuffer(base64.b64decode(figure['data'][0]['marker']['size']['bdata']), dtype='u1')
+
+
+def get_figure_z(figure):
+    """The values of the heatmap of the first trace of a figure, sent as a typed array"""
+    return np.frombuffer(base64.b64decode(figure['data'][0]['z']['bdata']), dtype='<f4')
+
+
+def get_patched_locations(patch):
+    """The locations in the figure updated by a `dash.Patch`"""
+    return [tuple(operation['location']) for operation in patch.to_plotly_json()['operations']]
+
+
+@requires_patch
+@pytest.mark.parametrize('prop_id', sorted(callbacks.MARKER_SIZE_INPUTS))
+def test_marker_size_input_patches_only_the_sizes(monkeypatch, data, prop_id):
+    trigger(monkeypatch, prop_id)
+
+    patch = callbacks.update_graph(data, *GRAPH_ARGS)
+
+    assert isinstance(patch, callbacks.Patch)
+    assert get_patched_locations(patch) == [('data', 0, 'marker', 'size')]
+
+
+@requires_patch
+def test_marker_colour_input_patches_only_the_colours(monkeypatch, data):
+    trigger(monkeypatch, 'dropdown-marker-colour.value')
+
+    patch = callbacks.update_graph(data, *GRAPH_ARGS)
+
+    assert isinstance(patch, callbacks.Patch)
+    locations = get_patched_locations(patch)
+    assert ('data', 0, 'marker', 'color') in locations
+    for location in locations:
+        assert location[:2] == ('data', 0)
+        assert location[2:] == ('meta',) or location[2] == 'marker' and location[3] != 'size'
+
+
+@requires_patch
+def test_size_and_colour_inputs_patch_both(monkeypatch, data):
+    trigger(monkeypatch, 'slider_marker_size_range.value', 'dropdown-marker-colour.value')
+
+    locations = get_patched_locations(callbacks.update_graph(data, *GRAPH_ARGS))
+
+    assert ('data', 0, 'marker', 'size') in locations
+    assert ('data', 0, 'marker', 'color') in locations
+    assert ('data', 0, 'x') not in locations and ('data', 0, 'y') not in locations
+
+
+@pytest.mark.parametrize('prop_id', ['app-memory.data', 'dropdown-x-axis.value', 'dropdown-y-axis.value'])
+def test_other_inputs_construct_the_whole_figure(monkeypatch, data, prop_id):
+    trigger(monkeypatch, prop_id)
+
+    figure = callbacks.update_graph(data, *GRAPH_ARGS)
+
+    assert isinstance(figure, dict)
+    assert len(figure['data']) == 1
+
+
+@pytest.mark.parametrize('render_mode', ['viewport', 'density'])
+@pytest.mark.parametrize('prop_ids', [('dropdown-x-axis.value',), ('dropdown-x-axis.value', 'graph.relayoutData')])
+def test_axis_change_ignores_the_stale_viewport(monkeypatch, data, prop_ids, render_mode):
+    # the ranges of the previous axes, the relayout data is cleared in the browser along with the axis change
+    data['render_mode'] = render_mode
+    data['density_max_points'] = N_POINTS
+    trigger(monkeypatch, *prop_ids)
+
+    figure = callbacks.update_graph(data, *GRAPH_ARGS, relayout_data=RELAYOUT_RANGES)
+
+    assert len(get_figure_x(figure)) == N_POINTS
+
+
+def test_axis_change_bins_all_points_into_the_heatmap(monkeypatch, data):
+    data['render_mode'] = 'density'
+    data['density_max_points'] = 0
+    trigger(monkeypatch, 'dropdown-x-axis.value')
+
+    figure = callbacks.update_graph(data, *GRAPH_ARGS, relayout_data=RELAYOUT_RANGES)
+
+    assert figure['data'][0]['type'] == 'heatmap'
+    assert np.rint(np.nansum(10. ** get_figure_z(figure))) == N_POINTS
+
+
+@pytest.mark.parametrize('relayout_data', [{'dragmode': 'lasso'}, {'autosize': True}, {'selections': []}])
+def test_relayout_without_viewport_change_is_ignored(monkeypatch, data, relayout_data):
+    data['render_mode'] = 'viewport'
+    trigger(monkeypatch, 'graph.relayoutData')
+
+    with pytest.raises(PreventUpdate):
+        callbacks.update_graph(data, *GRAPH_ARGS, relayout_data=relayout_data)
+
+
+@pytest.mark.parametrize('render_mode', ['viewport', 'density'])
+def test_relayout_with_ranges_renders_the_viewport(monkeypatch, data, render_mode):
+    data['render_mode'] = render_mode
+    data['density_max_points'] = N_POINTS
+    trigger(monkeypatch, 'graph.relayoutData')
+
+    figure = callbacks.update_graph(data, *GRAPH_ARGS, relayout_data=RELAYOUT_RANGES)
+
+    dataset = utils.get_dataset(data)
+    in_viewport = (utils.get_column(dataset, 0) >= 0.) & (utils.get_column(dataset, 1) >= 0.)
+    assert len(get_figure_x(figure)) == np.count_nonzero(in_viewport)
+
+
+@pytest.mark.parametrize('method', ['uniform', 'fps'])
+def test_axis_change_sends_only_the_sample(monkeypatch, data, method):
+    # no points of the stale viewport of the previous axes are added to the sample
+    data['sampling'] = dict(method=method, n_points=N_POINTS // 10)
+    trigger(monkeypatch, 'dropdown-x-axis.value')
+
+    figure = callbacks.update_graph(data, *GRAPH_ARGS, relayout_data=RELAYOUT_RANGES)
+
+    assert len(get_figure_x(figure)) == N_POINTS // 10
+
+
+@pytest.mark.parametrize('value, n_non_finite', [(np.nan, N_POINTS), (np.inf, N_POINTS // 2)])
+def test_density_of_a_non_finite_column(monkeypatch, data, value, n_non_finite):
+    # the extent is the one of the finite values, a unit range without any, only their points are binned
+    utils.get_dataset(data)['df'].iloc[:n_non_finite, 0] = value
+    data['render_mode'] = 'density'
+    data['density_max_points'] = 0
+    trigger(monkeypatch, 'dropdown-x-axis.value')
+
+    figure = callbacks.update_graph(data, *GRAPH_ARGS)
+
+    assert figure['data'][0]['type'] == 'heatmap'
+    assert np.rint(np.nansum(10. ** get_figure_z(figure))) == N_POINTS - n_non_finite
+
+
+def test_nan_sizes_are_the_smallest(monkeypatch, data):
+    utils.get_dataset(data)['df'].iloc[:N_POINTS // 2, 2] = np.nan
+    trigger(monkeypatch, 'app-memory.data')
+
+    sizes = get_figure_sizes(callbacks.update_graph(data, *GRAPH_ARGS))
+
+    assert np.all(sizes[:N_POINTS // 2] == GRAPH_ARGS[4][0])
+    assert np.all((sizes >= GRAPH_ARGS[4][0]) & (sizes <= GRAPH_ARGS[4][1]))
+
+
+def test_encode_marker_sizes_of_non_finite_sizes():
+    sizes = np.frombuffer(base64.b64decode(utils.encode_marker_sizes([np.nan, 7.6, np.inf, 20.])['bdata']), dtype='u1')
+
+    assert sizes.tolist() == [8, 8, 8, 20]
+
+
+def test_followed_file_constructs_the_whole_figure(monkeypatch, data):
+    # the figure of a followed file can have more traces of appended points
+    data['follow'] = True
+    trigger(monkeypatch, 'slider_marker_size_range.value')
+
+    figure = callbacks.update_graph(data, *GRAPH_ARGS)
+
+    assert isinstance(figure, dict)
+    assert figure['layout']['meta']['n_rows'] == N_POINTS